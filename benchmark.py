@@ -0,0 +1,332 @@
+from argparse        import ArgumentParser
+from asyncio         import StreamReader, StreamWriter, run, start_server
+from functools       import wraps
+from itertools       import product
+from json            import dumps
+from logging         import getLogger, ERROR
+from multiprocessing import Event, Process, Queue
+from os              import chdir, environ, getcwd
+from queue           import Empty
+from platform        import python_version
+from resource        import getrusage, RUSAGE_SELF
+from socket          import socket
+from sys             import stdout
+from tempfile        import TemporaryDirectory
+from time            import perf_counter
+
+class Upstream:
+
+    def __init__(self, width: int, depth: int, value_size: int, changed: int):
+        self.width      = width
+        self.depth      = depth
+        self.value_size = value_size
+        self.changed    = changed
+        self.hits:      dict[int, int] = {}
+        self.hooks      = 0
+        self.mails      = 0
+        self.__template = self.__build(depth, 0)
+
+    async def target(self, request):
+        from aiohttp import web
+        index = int(request.match_info['index'])
+        self.hits[index] = self.hits.get(index, 0) + 1
+        version = self.hits[index] if index < self.changed else 0
+        return web.Response(body=self.__render(index, version), content_type='application/json')
+
+    async def hook(self, request):
+        from aiohttp import web
+        await request.read()
+        self.hooks += 1
+        return web.json_response({})
+
+    async def mail(self, reader: StreamReader, writer: StreamWriter):
+        writer.write(b'220 localhost HttpDiff benchmark\r\n')
+        while line := await reader.readline():
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                writer.write(b'250-localhost\r\n250 AUTH PLAIN\r\n')
+            elif command.startswith('AUTH'):
+                writer.write(b'235 Authentication successful\r\n')
+            elif command == 'DATA':
+                writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                await writer.drain()
+                while (line := await reader.readline()) and line != b'.\r\n':
+                    pass
+                self.mails += 1
+                writer.write(b'250 OK\r\n')
+            elif command == 'QUIT':
+                writer.write(b'221 Bye\r\n')
+                await writer.drain()
+                break
+            else:
+                writer.write(b'250 OK\r\n')
+            await writer.drain()
+        writer.close()
+
+    def __render(self, index: int, version: int):
+        return f'{{"index":{index},"version":{version},"data":{self.__template}}}'.encode()
+
+    def __build(self, depth: int, offset: int):
+        if depth <= 0:
+            return dumps([offset, 'x' * self.value_size])
+        return '{' + ','.join(f'"k{key}":{self.__build(depth - 1, offset * self.width + key)}' for key in range(self.width)) + '}'
+
+
+def serve(http_port: int, smtp_port: int, width: int, depth: int, value_size: int, changed: int, ready):
+    from aiohttp import web
+
+    async def start():
+        upstream = Upstream(width, depth, value_size, changed)
+        application = web.Application()
+        application.router.add_get('/target/{index}', upstream.target)
+        application.router.add_post('/hook', upstream.hook)
+        runner = web.AppRunner(application, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', http_port).start()
+        mail_server = await start_server(upstream.mail, '127.0.0.1', smtp_port)
+        ready.set()
+        async with mail_server:
+            await mail_server.serve_forever()
+
+    run(start())
+
+
+class Recorder:
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+
+    def wrap(self, owner: type, name: str, phase: str):
+        function = getattr(owner, name)
+        samples  = self.samples.setdefault(phase, [])
+        if hasattr(function, '__wrapped__'):
+            function = function.__wrapped__
+
+        if phase in ['request', 'trigger']:
+            @wraps(function)
+            async def wrapper(*args, **kwargs):
+                started = perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    samples.append(perf_counter() - started)
+        else:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                started = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    samples.append(perf_counter() - started)
+        setattr(owner, name, wrapper)
+
+    def split(self, owner: type, name: str, phases: list[str]):
+        function = getattr(owner, name)
+        samples  = {phase: self.samples.setdefault(phase, []) for phase in phases}
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            for phase, seconds in result[-1].items():
+                if phase in samples:
+                    samples[phase].append(seconds)
+            return result
+        setattr(owner, name, wrapper)
+
+    def reset(self):
+        for samples in self.samples.values():
+            samples.clear()
+
+    def report(self):
+        return {phase: Recorder.percentiles(samples) for phase, samples in self.samples.items()}
+
+    @staticmethod
+    def percentiles(samples: list[float]):
+        if not samples:
+            return {'count': 0}
+        ordered = sorted(samples)
+        pick = lambda quantile: ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+        return {
+            'count': len(ordered),
+            'p50':   pick(0.50),
+            'p90':   pick(0.90),
+            'p99':   pick(0.99),
+            'max':   ordered[-1],
+            'total': sum(ordered),
+        }
+
+
+def free_port():
+    with socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def leaf_path(index: int, width: int, depth: int):
+    keys = []
+    for _ in range(depth):
+        index, key = divmod(index, width)
+        keys.insert(0, f'k{key}')
+    return '.'.join(['data', *keys, '0'])
+
+
+def configure(targets: int, width: int, depth: int, conditions: int, whole_body: bool, action: str, http_port: int, smtp_port: int, directory: str):
+    for key in [key for key in environ if key.startswith('HTTP_DIFF_')]:
+        del environ[key]
+    names = [f'BENCHMARK{index}' for index in range(targets)]
+    paths = ['version'] + [leaf_path(index, width, depth) for index in range(min(conditions - 1, width ** depth))]
+    body_conditions = [
+        {'source': f'[previous_body]@{path}', 'operator': 'different', 'destination': f'[current_body]@{path}'}
+        for path in paths
+    ]
+    if whole_body:
+        body_conditions.append({'source': '[previous_body]', 'operator': 'different', 'destination': '[current_body]'})
+    schema = dumps({
+        'status': {'source': '[current_status]', 'operator': 'different', 'destination': 200},
+        'body':   {'logic': 'or', 'conditions': body_conditions},
+    })
+    environ['HTTP_DIFF_AVAILABLE_REQUEST_NAMES'] = ','.join(names)
+    environ['HTTP_DIFF_RESULT_DIRECTORY']        = f'{directory}/history'
+    for index, name in enumerate(names):
+        environ[f'HTTP_DIFF_{name}_REQUEST_URL']              = f'http://127.0.0.1:{http_port}/target/{index}'
+        environ[f'HTTP_DIFF_{name}_REQUEST_METHOD']           = 'get'
+        environ[f'HTTP_DIFF_{name}_RULE_SCHEMA']              = schema
+        environ[f'HTTP_DIFF_{name}_TRIGGER_ACTION']           = action
+        environ[f'HTTP_DIFF_{name}_TRIGGER_EMAIL_USERNAME']   = 'benchmark'
+        environ[f'HTTP_DIFF_{name}_TRIGGER_EMAIL_PASSWORD']   = 'benchmark'
+        environ[f'HTTP_DIFF_{name}_TRIGGER_EMAIL_RECEIVERS']  = 'sink@localhost'
+        environ[f'HTTP_DIFF_{name}_TRIGGER_EMAIL_BODY']       = '$request.name$ $rule.body.0.source.value$ $rule.body.0.destination.value$'
+        environ[f'HTTP_DIFF_{name}_TRIGGER_EMAIL_SERVER']     = '127.0.0.1'
+        environ[f'HTTP_DIFF_{name}_TRIGGER_EMAIL_PORT']       = str(smtp_port)
+        environ[f'HTTP_DIFF_{name}_TRIGGER_EMAIL_STARTTLS']   = 'false'
+        environ[f'HTTP_DIFF_{name}_TRIGGER_REQUEST_URL']      = f'http://127.0.0.1:{http_port}/hook'
+        environ[f'HTTP_DIFF_{name}_TRIGGER_REQUEST_BODY']     = '{"name": "$request.name$", "value": "$rule.body.0.destination.value$"}'
+
+
+def isolated(results: Queue, arguments, parameters: tuple):
+    try:
+        results.put((True, scenario(arguments, *parameters)))
+    except BaseException as exception:
+        results.put((False, f'{type(exception).__name__}: {exception}'))
+        raise
+
+
+def isolate(arguments, *parameters):
+    results = Queue()
+    process = Process(target=isolated, args=(results, arguments, parameters))
+    process.start()
+    while True:
+        try:
+            succeeded, result = results.get(timeout=1)
+            break
+        except Empty:
+            if process.is_alive():
+                continue
+            try:
+                succeeded, result = results.get(timeout=1)
+                break
+            except Empty:
+                raise RuntimeError(f'Scenario {parameters} exited with code {process.exitcode} without a result')
+    process.join()
+    if not succeeded:
+        raise RuntimeError(f'Scenario {parameters} failed, {result}')
+    if process.exitcode != 0:
+        raise RuntimeError(f'Scenario {parameters} exited with code {process.exitcode}')
+    return result
+
+
+def scenario(arguments, targets: int, width: int, depth: int, conditions: int, trigger_rate: float):
+    import main
+    from history import FileHistory, SQLiteHistory
+    from request import Request
+    from rule    import Rule
+    from schema  import Schema
+    from trigger import Trigger
+
+    getLogger().setLevel(arguments.log_level)
+    recorder = Recorder()
+    recorder.wrap(Request, 'perform', 'request')
+    recorder.wrap(Schema, 'evaluate', 'rule')
+    recorder.split(Rule, 'evaluate', ['parse', 'extract', 'digest'])
+    recorder.wrap(FileHistory, 'flush', 'history')
+    recorder.wrap(SQLiteHistory, 'flush', 'history')
+    recorder.wrap(Trigger, 'perform', 'trigger')
+
+    http_port, smtp_port = free_port(), free_port()
+    ready  = Event()
+    server = Process(target=serve, args=(http_port, smtp_port, width, depth, arguments.value_size, int(targets * trigger_rate), ready), daemon=True)
+    server.start()
+    ready.wait(30)
+    working_directory = getcwd()
+    runs = []
+    try:
+        with TemporaryDirectory() as directory:
+            chdir(directory)
+            configure(targets, width, depth, conditions, arguments.whole_body, arguments.action, http_port, smtp_port, directory)
+            for index in range(arguments.runs + 1):
+                recorder.reset()
+                started = perf_counter()
+                run(main.main())
+                elapsed = perf_counter() - started
+                if index == 0:
+                    continue
+                runs.append({
+                    'run':        index,
+                    'seconds':    elapsed,
+                    'throughput': targets / elapsed if elapsed > 0 else None,
+                    'phases':     recorder.report(),
+                })
+    finally:
+        chdir(working_directory)
+        server.terminate()
+        server.join()
+    return {
+        'scenario': {
+            'targets':      targets,
+            'width':        width,
+            'depth':        depth,
+            'leaves':       width ** depth,
+            'value_size':   arguments.value_size,
+            'conditions':   conditions,
+            'whole_body':   arguments.whole_body,
+            'trigger_rate': trigger_rate,
+            'action':       arguments.action,
+        },
+        'runs':        runs,
+        'peak_rss_kb': getrusage(RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def numbers(kind: type):
+    return lambda value: [kind(item) for item in value.split(',')]
+
+
+def parse():
+    parser = ArgumentParser(description='Offline benchmark of the HttpDiff request, rule and trigger pipeline')
+    parser.add_argument('--targets',      type=numbers(int),   default=[100],  help='comma separated target counts')
+    parser.add_argument('--width',        type=numbers(int),   default=[10],   help='comma separated keys per level of the response body')
+    parser.add_argument('--depth',        type=numbers(int),   default=[2],    help='comma separated nesting depths of the response body')
+    parser.add_argument('--conditions',   type=numbers(int),   default=[1],    help='comma separated body conditions per schema')
+    parser.add_argument('--trigger-rate', type=numbers(float), default=[0.1],  help='comma separated fractions of targets changing every run')
+    parser.add_argument('--value-size',   type=int,            default=16,     help='characters of every leaf value')
+    parser.add_argument('--whole-body',   action='store_true',                 help='also compare the whole body, exercising full flattening')
+    parser.add_argument('--action',       choices=['none', 'email', 'request'], default='request')
+    parser.add_argument('--runs',         type=int,            default=3,      help='measured runs after the run seeding history')
+    parser.add_argument('--output',       default='-',                         help="path of the json report, '-' for stdout")
+    parser.add_argument('--log-level',    default=ERROR)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse()
+    report = {
+        'python':    python_version(),
+        'scenarios': [],
+    }
+    for targets, width, depth, conditions, trigger_rate in product(arguments.targets, arguments.width, arguments.depth, arguments.conditions, arguments.trigger_rate):
+        report['scenarios'].append(isolate(arguments, targets, width, depth, conditions, trigger_rate))
+    if arguments.output == '-':
+        stdout.write(dumps(report, indent=4) + '\n')
+    else:
+        with open(arguments.output, 'w') as output:
+            output.write(dumps(report, indent=4) + '\n')
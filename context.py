@@ -0,0 +1,27 @@
+from typing import Callable, Iterator, Mapping
+
+class Context (Mapping):
+
+    def __init__(self, values: dict[str, object] = None, deferred: dict[str, Callable[[], object]] = None):
+        self.__values   = dict(values or {})
+        self.__deferred = dict(deferred or {})
+
+    def set(self, values: dict[str, object]):
+        self.__values.update(values)
+
+    def defer(self, deferred: dict[str, Callable[[], object]]):
+        self.__deferred.update(deferred)
+
+    def __getitem__(self, key: str):
+        if key not in self.__values:
+            self.__values[key] = self.__deferred.pop(key)()
+        return self.__values[key]
+
+    def __contains__(self, key: object):
+        return key in self.__values or key in self.__deferred
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([*self.__values, *self.__deferred])
+
+    def __len__(self):
+        return len(self.__values) + len(self.__deferred)
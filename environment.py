@@ -1,7 +1,17 @@
-from dotenv  import load_dotenv
-from json    import loads
-from pathlib import Path
-from os      import getenv
+from dotenv   import dotenv_values
+from hashlib  import sha256
+from json     import loads
+from logging  import info
+from marshal  import dumps as marshal_dumps, loads as marshal_loads
+from os       import environ, fdopen, getenv, replace
+from pathlib  import Path
+from sys      import version_info
+from tempfile import mkstemp
+
+try:
+    from yaml import safe_load
+except ImportError:
+    safe_load = None
 
 class Environment:
 
@@ -14,9 +24,14 @@ class Environment:
         'HTTP_DIFF_@>@_REQUEST_CONTENT_TYPE',
         'HTTP_DIFF_@>@_REQUEST_HEADERS',
         'HTTP_DIFF_@>@_REQUEST_BODY',
+        'HTTP_DIFF_@>@_REQUEST_MAX_SIZE',
+        'HTTP_DIFF_@>@_REQUEST_RETRIES',
+        'HTTP_DIFF_@>@_REQUEST_HEDGE',
         'HTTP_DIFF_@>@_RULE_SCHEMA',
         'HTTP_DIFF_@>@_RULE_LOGIC',
         'HTTP_DIFF_@>@_TRIGGER_ACTION',
+        'HTTP_DIFF_@>@_TRIGGER_COOLDOWN',
+        'HTTP_DIFF_@>@_TRIGGER_DEDUPLICATE',
 
         'HTTP_DIFF_@>@_TRIGGER_EMAIL_USERNAME',
         'HTTP_DIFF_@>@_TRIGGER_EMAIL_PASSWORD',
@@ -25,43 +40,138 @@ class Environment:
         'HTTP_DIFF_@>@_TRIGGER_EMAIL_BODY',
         'HTTP_DIFF_@>@_TRIGGER_EMAIL_SERVER',
         'HTTP_DIFF_@>@_TRIGGER_EMAIL_PORT',
+        'HTTP_DIFF_@>@_TRIGGER_EMAIL_STARTTLS',
 
         'HTTP_DIFF_@>@_TRIGGER_REQUEST_URL',
         'HTTP_DIFF_@>@_TRIGGER_REQUEST_METHOD',
         'HTTP_DIFF_@>@_TRIGGER_REQUEST_HEADERS',
         'HTTP_DIFF_@>@_TRIGGER_REQUEST_BODY',
+
+        'HTTP_DIFF_@>@_SCHEDULE_INTERVAL',
+    ]
+
+    __secrets = ['REQUEST_HEADERS', 'TRIGGER_EMAIL_PASSWORD', 'TRIGGER_REQUEST_HEADERS']
+
+    __default_env_global = [
+        'HTTP_DIFF_MODE',
+        'HTTP_DIFF_METRICS_PORT',
+        'HTTP_DIFF_METRICS_TEXTFILE',
+        'HTTP_DIFF_METRICS_PUSHGATEWAY_URL',
+        'HTTP_DIFF_HISTORY_BACKEND',
+        'HTTP_DIFF_HISTORY_RETENTION_COUNT',
+        'HTTP_DIFF_HISTORY_RETENTION_AGE',
+        'HTTP_DIFF_SCHEDULE_JITTER',
+        'HTTP_DIFF_CONCURRENCY_LIMIT',
+        'HTTP_DIFF_CONCURRENCY_LIMIT_PER_HOST',
+        'HTTP_DIFF_RATE_LIMIT_PER_HOST',
+        'HTTP_DIFF_RATE_BURST_PER_HOST',
+        'HTTP_DIFF_SESSION_LIMIT',
+        'HTTP_DIFF_SESSION_LIMIT_PER_HOST',
+        'HTTP_DIFF_SESSION_KEEPALIVE_TIMEOUT',
+        'HTTP_DIFF_SESSION_DNS_CACHE_TTL',
+        'HTTP_DIFF_TRIGGER_WORKERS',
+        'HTTP_DIFF_TRIGGER_QUEUE_SIZE',
+        'HTTP_DIFF_TRIGGER_COALESCE_WINDOW',
+        'HTTP_DIFF_SHARD_COUNT',
+        'HTTP_DIFF_WORKER_PROCESSES',
     ]
 
     @staticmethod
     def __load_env():
+        config_file = getenv('HTTP_DIFF_CONFIG_FILE')
+        if config_file:
+            return Environment.__load_file(Path(config_file))
         env_file = Path(Environment.__default_env_path)
-        if not env_file.exists():
-            request_names = getenv('HTTP_DIFF_AVAILABLE_REQUEST_NAMES')
-            if request_names is None:
-                raise KeyError(f'Missing HTTP_DIFF_AVAILABLE_REQUEST_NAMES key in env')
-            result_directory = getenv('HTTP_DIFF_RESULT_DIRECTORY')
-            if result_directory is None:
-                result_directory = 'history'
-            env_dict: dict[str, str] = {
-                'HTTP_DIFF_AVAILABLE_REQUEST_NAMES': request_names,
-                'HTTP_DIFF_RESULT_DIRECTORY':        result_directory,
-            }
-            request_names = env_dict['HTTP_DIFF_AVAILABLE_REQUEST_NAMES'].split(',')
-            for name in request_names:
-                for requirement in Environment.__default_env_requirement:
-                    key = requirement.replace('@>@', name.upper())
-                    env_dict[key] = getenv(key)
-            return env_dict
-        ok = load_dotenv(dotenv_path=env_file)
-        if not ok:
-            raise Exception("Can't load env file")
-        keys = []
-        with env_file.open("r", encoding="utf-8") as f:
-            for line in f:
-                if "=" in line and not line.strip().startswith("#"):
-                    key = line.split("=", 1)[0].strip()
-                    keys.append(key)
-        return {key: getenv(key) for key in keys}
+        file_dict = dotenv_values(env_file) if env_file.exists() else {}
+        keys = list(file_dict) + [key for key in environ if key.startswith('HTTP_DIFF_') and key not in file_dict]
+        env_dict = {key: environ[key] if key in environ else file_dict[key] for key in keys}
+        if 'HTTP_DIFF_AVAILABLE_REQUEST_NAMES' not in env_dict:
+            raise KeyError(f'Missing HTTP_DIFF_AVAILABLE_REQUEST_NAMES key in env')
+        return env_dict
+
+    @staticmethod
+    def __load_file(config_file: Path):
+        if not config_file.exists():
+            raise FileNotFoundError(f'Config file {config_file} does not exist')
+        text = config_file.read_text(encoding='utf-8')
+        if config_file.suffix in ['.yaml', '.yml']:
+            if safe_load is None:
+                raise ImportError(f'PyYAML is required to load {config_file}, install it or use a json config file')
+            config = safe_load(text)
+        else:
+            config = loads(text)
+        if not isinstance(config, dict) or not isinstance(config.get('requests'), dict):
+            raise KeyError(f"Config file {config_file} must be an object with a 'requests' object")
+        names = list(config['requests'])
+        known = set(Environment.__default_env_global) | {'HTTP_DIFF_AVAILABLE_REQUEST_NAMES', 'HTTP_DIFF_RESULT_DIRECTORY'}
+        for name in names:
+            known.update(requirement.replace('@>@', name.upper()) for requirement in Environment.__default_env_requirement)
+        env_dict = {'HTTP_DIFF_AVAILABLE_REQUEST_NAMES': ','.join(names)}
+        for key, value in config.items():
+            if key == 'requests':
+                for name, request in value.items():
+                    Environment.__flatten_file(env_dict, known, f'HTTP_DIFF_{name}', request)
+            else:
+                Environment.__flatten_file(env_dict, known, f'HTTP_DIFF_{key.upper()}', value)
+        for name in names:
+            env_dict.update({key: environ[key] for key in Environment.__secret_keys(name.upper()) if key in environ})
+        return env_dict
+
+    @staticmethod
+    def __flatten_file(env_dict: dict, known: set[str], key: str, value: object):
+        if key in known:
+            if isinstance(value, bool):
+                value = str(value).lower()
+            elif isinstance(value, list) and all(isinstance(item, str) for item in value) and key.endswith('_RECEIVERS'):
+                value = ','.join(value)
+            env_dict[key] = value
+        elif isinstance(value, dict):
+            for child_key, child_value in value.items():
+                Environment.__flatten_file(env_dict, known, f'{key}_{child_key.upper()}', child_value)
+        else:
+            raise KeyError(f'{key} of config file is not supported')
+
+    @staticmethod
+    def __sources():
+        config_file = getenv('HTTP_DIFF_CONFIG_FILE')
+        env_file    = Path(Environment.__default_env_path)
+        files       = [Path(config_file)] if config_file else [env_file] if env_file.exists() else []
+        environment = sorted((key, value) for key, value in environ.items() if key.startswith('HTTP_DIFF_') and key != 'HTTP_DIFF_SHARD_INDEX')
+        return sha256(Path(__file__).read_bytes() + repr(environment).encode()).hexdigest(), files
+
+    @staticmethod
+    def __fingerprint(file: Path, saved: tuple | None = None):
+        status = file.stat()
+        if saved is not None and saved[0] == str(file) and saved[1] == status.st_mtime_ns and saved[2] == status.st_size:
+            return saved
+        return str(file), status.st_mtime_ns, status.st_size, sha256(file.read_bytes()).hexdigest()
+
+    @staticmethod
+    def __load_snapshot(snapshot_file: Path, environment: str, files: list[Path]):
+        if not snapshot_file.exists():
+            return None, []
+        try:
+            snapshot = marshal_loads(snapshot_file.read_bytes())
+        except Exception:
+            return None, []
+        if snapshot.get('python') != list(version_info[:2]) or snapshot.get('environment') != environment or len(snapshot.get('files', [])) != len(files):
+            return None, []
+        fingerprints = [Environment.__fingerprint(file, tuple(saved)) for file, saved in zip(files, snapshot['files'])]
+        if [fingerprint[3] for fingerprint in fingerprints] != [saved[3] for saved in snapshot['files']]:
+            return None, fingerprints
+        return snapshot, fingerprints
+
+    @staticmethod
+    def __save_snapshot(snapshot_file: Path, snapshot: dict):
+        snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temporary_path = mkstemp(dir=snapshot_file.parent, prefix=f'.{snapshot_file.name}.', suffix='.tmp')
+        try:
+            with fdopen(descriptor, 'wb') as temporary_file:
+                temporary_file.write(marshal_dumps(snapshot))
+            replace(temporary_path, snapshot_file)
+        except Exception:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
 
     @staticmethod
     def __validate_env(env_dict: dict[str, str]):
@@ -74,7 +184,7 @@ class Environment:
 
     @staticmethod
     def __validate_dict(env_dict: dict[str, str]):
-        request_names = set(env_dict['HTTP_DIFF_AVAILABLE_REQUEST_NAMES'].replace(' ', '').split(','))
+        request_names = Environment.__request_names(env_dict)
         for name in request_names:
             if name != name.upper():
                 raise KeyError(f"{name} must be uppercase")
@@ -85,11 +195,22 @@ class Environment:
                 if env not in env_dict:
                     raise KeyError(f'{env} required')
 
+    @staticmethod
+    def __request_names(env_dict: dict[str, str]):
+        return list(dict.fromkeys(name for name in env_dict['HTTP_DIFF_AVAILABLE_REQUEST_NAMES'].replace(' ', '').split(',') if name))
+
+    @staticmethod
+    def __get_json(env_dict: dict[str, str], key: str, fallback: str = None):
+        value = Environment.__get_env(env_dict, key, fallback)
+        return loads(value) if isinstance(value, str) else value
+
     @staticmethod
     def __get_env(env_dict: dict[str, str], key: str, fallback = None, options: list[str] = []):
         if key not in env_dict or env_dict[key] is None:
             return fallback
         value = env_dict[key]
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
         if len(options) > 0:
             if value not in options:
                 raise ValueError(f"{key}={value} isn't supported, must in {options}")
@@ -97,50 +218,168 @@ class Environment:
 
     @staticmethod
     def __build_dict(env_dict: dict[str, str]):
-        request_names = set(env_dict['HTTP_DIFF_AVAILABLE_REQUEST_NAMES'].replace(' ', '').split(','))
+        request_names = Environment.__request_names(env_dict)
         requests = []
         for name in request_names:
-            request_builder = {}
-            for _ in env_dict:
-                env = f'HTTP_DIFF_{name}'
-                request_builder = {
-                    'name':         name,
-                    'result_dir':   Environment.__get_env(env_dict, 'HTTP_DIFF_RESULT_DIRECTORY', 'history'),
-                    'url':          Environment.__get_env(env_dict, f'{env}_REQUEST_URL'),
-                    'method':       Environment.__get_env(env_dict, f'{env}_REQUEST_METHOD', 'post', ['post', 'get', 'put', 'patch', 'delete']).lower(),
-                    'timeout':      int(Environment.__get_env(env_dict, f'{env}_REQUEST_TIMEOUT', 5)),
-                    'content_type': Environment.__get_env(env_dict, f'{env}_REQUEST_CONTENT_TYPE', 'application/json', ['application/json', 'application/x-www-form-urlencoded']).lower(),
-                    'headers':      loads(Environment.__get_env(env_dict, f'{env}_REQUEST_HEADERS', '{"User-Agent": "HttpDiff"}')),
-                    'body':         loads(Environment.__get_env(env_dict, f'{env}_REQUEST_BODY', '{}')),
-                    'rule': {
-                        'schema': loads(Environment.__get_env(env_dict, f'{env}_RULE_SCHEMA')),
-                        'logic':  Environment.__get_env(env_dict, f'{env}_RULE_LOGIC', 'or', ['or','and']).lower(),
+            env = f'HTTP_DIFF_{name}'
+            requests.append(Environment.__resolve_secrets(env_dict, {
+                'name':         name,
+                'url':          Environment.__get_env(env_dict, f'{env}_REQUEST_URL'),
+                'method':       Environment.__get_env(env_dict, f'{env}_REQUEST_METHOD', 'post', ['post', 'get', 'put', 'patch', 'delete']).lower(),
+                'timeout':      int(Environment.__get_env(env_dict, f'{env}_REQUEST_TIMEOUT', 5)),
+                'content_type': Environment.__get_env(env_dict, f'{env}_REQUEST_CONTENT_TYPE', 'application/json', ['application/json', 'application/x-www-form-urlencoded']).lower(),
+                'body':         Environment.__get_json(env_dict, f'{env}_REQUEST_BODY', '{}'),
+                'max_size':     int(Environment.__get_env(env_dict, f'{env}_REQUEST_MAX_SIZE', 10485760)),
+                'retries':      int(Environment.__get_env(env_dict, f'{env}_REQUEST_RETRIES', 2)),
+                'hedge':        Environment.__get_env(env_dict, f'{env}_REQUEST_HEDGE', 'false', ['true', 'false']).lower() == 'true',
+                'interval':     float(Environment.__get_env(env_dict, f'{env}_SCHEDULE_INTERVAL', 60)),
+                'rule': {
+                    'schema': Environment.__get_json(env_dict, f'{env}_RULE_SCHEMA'),
+                    'logic':  Environment.__get_env(env_dict, f'{env}_RULE_LOGIC', 'or', ['or','and']).lower(),
+                },
+                'trigger': {
+                    'action':      Environment.__get_env(env_dict, f'{env}_TRIGGER_ACTION', 'none', ['none', 'email', 'request']).lower(),
+                    'cooldown':    float(Environment.__get_env(env_dict, f'{env}_TRIGGER_COOLDOWN', 0)),
+                    'deduplicate': Environment.__get_env(env_dict, f'{env}_TRIGGER_DEDUPLICATE', 'false', ['true', 'false']).lower() == 'true',
+                    'email': {
+                        'username':  Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_USERNAME'),
+                        'receivers': Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_RECEIVERS', '').split(','),
+                        'subject':   Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_SUBJECT', 'HttpDiff alerting'),
+                        'body':      Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_BODY', ''),
+                        'server':    Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_SERVER', 'smtp.gmail.com'),
+                        'port':      Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_PORT', 587),
+                        'starttls':  Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_STARTTLS', 'true', ['true', 'false']).lower() == 'true',
                     },
-                    'trigger': {
-                        'action': Environment.__get_env(env_dict, f'{env}_TRIGGER_ACTION', 'none', ['none', 'email', 'request']).lower(),
-                        'email': {
-                            'username':  Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_USERNAME'),
-                            'password':  Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_PASSWORD'),
-                            'receivers': Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_RECEIVERS', '').split(','),
-                            'subject':   Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_SUBJECT', 'HttpDiff alerting'),
-                            'body':      Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_BODY', ''),
-                            'server':    Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_SERVER', 'smtp.gmail.com'),
-                            'port':      Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_PORT', 587),
-                        },
-                        'request': {
-                            'url':     Environment.__get_env(env_dict, f'{env}_TRIGGER_REQUEST_URL'),
-                            'method':  Environment.__get_env(env_dict, f'{env}_TRIGGER_REQUEST_METHOD', 'post', ['post', 'get', 'put', 'patch', 'delete']),
-                            'headers': loads(Environment.__get_env(env_dict, f'{env}_TRIGGER_REQUEST_HEADERS', '{"User-Agent": "HttpDiff"}')),
-                            'body':    loads(Environment.__get_env(env_dict, f'{env}_TRIGGER_REQUEST_BODY', '{}')),
-                        },
+                    'request': {
+                        'url':     Environment.__get_env(env_dict, f'{env}_TRIGGER_REQUEST_URL'),
+                        'method':  Environment.__get_env(env_dict, f'{env}_TRIGGER_REQUEST_METHOD', 'post', ['post', 'get', 'put', 'patch', 'delete']),
+                        'body':    Environment.__get_json(env_dict, f'{env}_TRIGGER_REQUEST_BODY', '{}'),
                     },
-                }
-            requests.append(request_builder)
+                },
+            }))
         return requests
 
     @staticmethod
-    def analyze_env():
+    def __secret_keys(name: str):
+        return [f'HTTP_DIFF_{name}_{key}' for key in Environment.__secrets]
+
+    @staticmethod
+    def __load_secrets(requests: list[dict]):
+        env_file  = Path(Environment.__default_env_path)
+        file_dict = dotenv_values(env_file) if env_file.exists() and not getenv('HTTP_DIFF_CONFIG_FILE') else {}
+        keys      = [key for request in requests for key in Environment.__secret_keys(request['name'])]
+        return {key: environ[key] if key in environ else file_dict[key] for key in keys if key in environ or key in file_dict}
+
+    @staticmethod
+    def __resolve_secrets(env_dict: dict[str, str], request: dict):
+        env = f"HTTP_DIFF_{request['name']}"
+        request['headers']                       = Environment.__get_json(env_dict, f'{env}_REQUEST_HEADERS', '{"User-Agent": "HttpDiff"}')
+        request['trigger']['email']['password']  = Environment.__get_env(env_dict, f'{env}_TRIGGER_EMAIL_PASSWORD')
+        request['trigger']['request']['headers'] = Environment.__get_json(env_dict, f'{env}_TRIGGER_REQUEST_HEADERS', '{"User-Agent": "HttpDiff"}')
+        return request
+
+    @staticmethod
+    def __strip_secrets(request: dict):
+        trigger = request['trigger']
+        return {
+            **request,
+            'headers': None,
+            'trigger': {
+                **trigger,
+                'email':   {**trigger['email'], 'password': None},
+                'request': {**trigger['request'], 'headers': None},
+            },
+        }
+
+    @staticmethod
+    def __build_global_dict(env_dict: dict[str, str]):
+        return {
+            'mode': Environment.__get_env(env_dict, 'HTTP_DIFF_MODE', 'oneshot', ['oneshot', 'daemon']).lower(),
+            'history': {
+                'backend':         Environment.__get_env(env_dict, 'HTTP_DIFF_HISTORY_BACKEND', 'sqlite', ['sqlite', 'file']).lower(),
+                'directory':       Environment.__get_env(env_dict, 'HTTP_DIFF_RESULT_DIRECTORY', 'history'),
+                'retention_count': int(Environment.__get_env(env_dict, 'HTTP_DIFF_HISTORY_RETENTION_COUNT', 100)),
+                'retention_age':   float(Environment.__get_env(env_dict, 'HTTP_DIFF_HISTORY_RETENTION_AGE', 0)),
+            },
+            'metrics': {
+                'port':            int(Environment.__get_env(env_dict, 'HTTP_DIFF_METRICS_PORT', 0)),
+                'textfile':        Environment.__get_env(env_dict, 'HTTP_DIFF_METRICS_TEXTFILE'),
+                'pushgateway_url': Environment.__get_env(env_dict, 'HTTP_DIFF_METRICS_PUSHGATEWAY_URL'),
+            },
+            'schedule': {
+                'jitter': float(Environment.__get_env(env_dict, 'HTTP_DIFF_SCHEDULE_JITTER', 0.1)),
+            },
+            'limiter': {
+                'limit':          int(Environment.__get_env(env_dict, 'HTTP_DIFF_CONCURRENCY_LIMIT', 50)),
+                'limit_per_host': int(Environment.__get_env(env_dict, 'HTTP_DIFF_CONCURRENCY_LIMIT_PER_HOST', 0)),
+                'rate_per_host':  float(Environment.__get_env(env_dict, 'HTTP_DIFF_RATE_LIMIT_PER_HOST', 0)),
+                'burst_per_host': int(Environment.__get_env(env_dict, 'HTTP_DIFF_RATE_BURST_PER_HOST', 1)),
+            },
+            'session': {
+                'limit':             int(Environment.__get_env(env_dict, 'HTTP_DIFF_SESSION_LIMIT', 100)),
+                'limit_per_host':    int(Environment.__get_env(env_dict, 'HTTP_DIFF_SESSION_LIMIT_PER_HOST', 10)),
+                'keepalive_timeout': float(Environment.__get_env(env_dict, 'HTTP_DIFF_SESSION_KEEPALIVE_TIMEOUT', 30)),
+                'dns_cache_ttl':     int(Environment.__get_env(env_dict, 'HTTP_DIFF_SESSION_DNS_CACHE_TTL', 300)),
+            },
+            'trigger': {
+                'workers':         int(Environment.__get_env(env_dict, 'HTTP_DIFF_TRIGGER_WORKERS', 4)),
+                'queue_size':      int(Environment.__get_env(env_dict, 'HTTP_DIFF_TRIGGER_QUEUE_SIZE', 100)),
+                'coalesce_window': float(Environment.__get_env(env_dict, 'HTTP_DIFF_TRIGGER_COALESCE_WINDOW', 0)),
+                'state_file':      f"{Environment.__get_env(env_dict, 'HTTP_DIFF_RESULT_DIRECTORY', 'history')}/trigger-state.json",
+            },
+            'shard': {
+                'index': 0,
+                'count': int(Environment.__get_env(env_dict, 'HTTP_DIFF_SHARD_COUNT', 1)),
+            },
+            'worker_processes': int(Environment.__get_env(env_dict, 'HTTP_DIFF_WORKER_PROCESSES', 0)),
+        }
+
+    @staticmethod
+    def __shard_index():
+        index = getenv('HTTP_DIFF_SHARD_INDEX') or getenv('JOB_COMPLETION_INDEX') or '0'
+        if not index.isdigit():
+            raise ValueError(f'Shard index {index} must be a non-negative integer')
+        return int(index)
+
+    @staticmethod
+    def analyze():
+        environment, files = Environment.__sources()
+        snapshot_path = getenv('HTTP_DIFF_CONFIG_SNAPSHOT', f"{getenv('HTTP_DIFF_RESULT_DIRECTORY', 'history')}/.config.snapshot")
+        snapshot_file = Path(snapshot_path) if snapshot_path else None
+        if snapshot_file is not None:
+            snapshot, fingerprints = Environment.__load_snapshot(snapshot_file, environment, files)
+            if snapshot is not None:
+                info(f'Config loaded from snapshot {snapshot_file}')
+                if [list(fingerprint) for fingerprint in fingerprints] != snapshot['files']:
+                    snapshot['files'] = [list(fingerprint) for fingerprint in fingerprints]
+                    Environment.__save_snapshot(snapshot_file, snapshot)
+                env_dict = Environment.__load_secrets(snapshot['requests'])
+                for request in snapshot['requests']:
+                    Environment.__resolve_secrets(env_dict, request)
+                snapshot['settings']['shard']['index'] = Environment.__shard_index()
+                return snapshot['settings'], snapshot['requests']
         env_dict = Environment.__load_env()
         Environment.__validate_env(env_dict)
         Environment.__validate_dict(env_dict)
-        return Environment.__build_dict(env_dict)
+        settings = Environment.__build_global_dict(env_dict)
+        requests = Environment.__build_dict(env_dict)
+        if snapshot_file is not None and getenv('HTTP_DIFF_CONFIG_FILE') and any(key in env_dict and key not in environ for request in requests for key in Environment.__secret_keys(request['name'])):
+            info(f"Config snapshot skipped, {getenv('HTTP_DIFF_CONFIG_FILE')} holds request headers, email passwords or trigger request headers")
+        elif snapshot_file is not None:
+            Environment.__save_snapshot(snapshot_file, {
+                'python':      list(version_info[:2]),
+                'environment': environment,
+                'files':       [list(Environment.__fingerprint(file)) for file in files],
+                'settings':    settings,
+                'requests':    [Environment.__strip_secrets(request) for request in requests],
+            })
+        settings['shard']['index'] = Environment.__shard_index()
+        return settings, requests
+
+    @staticmethod
+    def analyze_global_env():
+        return Environment.analyze()[0]
+
+    @staticmethod
+    def analyze_env():
+        return Environment.analyze()[1]
@@ -0,0 +1,190 @@
+from json     import dumps, loads
+from logging  import info
+from metrics  import metrics
+from os       import fdopen, replace
+from pathlib  import Path
+from sqlite3  import connect, Connection
+from tempfile import mkstemp
+from time     import time
+from typing   import Iterator
+
+class History:
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._pending:   dict[str, tuple[float, dict]] = {}
+        self._latencies: dict[str, dict] = {}
+
+    def location(self, name: str) -> str:
+        raise NotImplementedError
+
+    def load(self, name: str) -> dict | None:
+        raise NotImplementedError
+
+    def save(self, name: str, data: dict):
+        self._pending[name] = (time(), data)
+
+    def series(self, name: str, since: float = 0, until: float = float('inf')) -> Iterator[tuple[float, dict]]:
+        raise NotImplementedError
+
+    def names(self) -> list[str]:
+        raise NotImplementedError
+
+    def load_latency(self, name: str) -> dict | None:
+        raise NotImplementedError
+
+    def save_latency(self, name: str, profile: dict):
+        self._latencies[name] = profile
+
+    def flush(self):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class FileHistory (History):
+
+    def location(self, name: str):
+        return f'{self.directory}/{name}.json'
+
+    def load(self, name: str):
+        file_path = Path(self.location(name))
+        if not file_path.exists():
+            return None
+        return loads(file_path.read_text())
+
+    def series(self, name: str, since: float = 0, until: float = float('inf')):
+        file_path = Path(self.location(name))
+        if file_path.exists() and since <= file_path.stat().st_mtime <= until:
+            yield file_path.stat().st_mtime, loads(file_path.read_text())
+
+    def names(self):
+        return sorted(file_path.stem for file_path in Path(self.directory).glob('*.json') if file_path.stem == file_path.stem.upper())
+
+    def load_latency(self, name: str):
+        file_path = Path(f'{self.directory}/{name}.latency.json')
+        if not file_path.exists():
+            return None
+        return loads(file_path.read_text())
+
+    def flush(self):
+        if not self._pending and not self._latencies:
+            return
+        with metrics.timer('history_flush'):
+            self.__write()
+
+    def __write(self):
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        pending,   self._pending   = self._pending, {}
+        latencies, self._latencies = self._latencies, {}
+        for name, (_, data) in pending.items():
+            self.__write_file(Path(self.location(name)), dumps(data, indent=4, ensure_ascii=True))
+        for name, profile in latencies.items():
+            self.__write_file(Path(f'{self.directory}/{name}.latency.json'), dumps(profile))
+        if pending:
+            info(f'History saved {len(pending)} snapshots to {self.directory}')
+
+    def __write_file(self, file_path: Path, text: str):
+        descriptor, temporary_path = mkstemp(dir=file_path.parent, prefix=f'.{file_path.name}.', suffix='.tmp')
+        try:
+            with fdopen(descriptor, 'w') as temporary_file:
+                temporary_file.write(text)
+            Path(temporary_path).chmod(0o644)
+            replace(temporary_path, file_path)
+        except Exception:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
+
+
+class SQLiteHistory (History):
+
+    __file_name = 'history.sqlite3'
+
+    def __init__(self, directory: str, retention_count: int = 100, retention_age: float = 0):
+        super().__init__(directory)
+        self.retention_count = retention_count
+        self.retention_age   = retention_age
+        self.__connection: Connection = None
+
+    def location(self, name: str):
+        return f'{self.directory}/{self.__file_name}'
+
+    def load(self, name: str):
+        row = self.__connect().execute(
+            'SELECT data FROM snapshots WHERE name = ? ORDER BY timestamp DESC LIMIT 1',
+            (name,),
+        ).fetchone()
+        if row is not None:
+            return loads(row[0])
+        legacy_file = Path(f'{self.directory}/{name}.json')
+        if legacy_file.exists():
+            return loads(legacy_file.read_text())
+        return None
+
+    def series(self, name: str, since: float = 0, until: float = float('inf')):
+        cursor = self.__connect().execute(
+            'SELECT timestamp, data FROM snapshots WHERE name = ? AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp',
+            (name, since, until),
+        )
+        for timestamp, data in cursor:
+            yield timestamp, loads(data)
+
+    def names(self):
+        return [row[0] for row in self.__connect().execute('SELECT DISTINCT name FROM snapshots ORDER BY name')]
+
+    def load_latency(self, name: str):
+        row = self.__connect().execute('SELECT data FROM latencies WHERE name = ?', (name,)).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def flush(self):
+        if not self._pending and not self._latencies:
+            return
+        with metrics.timer('history_flush'):
+            self.__write()
+
+    def __write(self):
+        pending,   self._pending   = self._pending, {}
+        latencies, self._latencies = self._latencies, {}
+        connection = self.__connect()
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO latencies (name, data) VALUES (?, ?)',
+                [(name, dumps(profile, separators=(',', ':'))) for name, profile in latencies.items()],
+            )
+            connection.executemany(
+                'INSERT INTO snapshots (name, timestamp, data) VALUES (?, ?, ?)',
+                [(name, timestamp, dumps(data, separators=(',', ':'))) for name, (timestamp, data) in pending.items()],
+            )
+            if self.retention_count > 0:
+                connection.executemany(
+                    'DELETE FROM snapshots WHERE name = ? AND timestamp < ('
+                    'SELECT timestamp FROM snapshots WHERE name = ? ORDER BY timestamp DESC LIMIT 1 OFFSET ?)',
+                    [(name, name, self.retention_count - 1) for name in pending],
+                )
+            if self.retention_age > 0:
+                connection.execute(
+                    'DELETE FROM snapshots WHERE timestamp < ? AND timestamp < ('
+                    'SELECT MAX(latest.timestamp) FROM snapshots AS latest WHERE latest.name = snapshots.name)',
+                    (time() - self.retention_age,),
+                )
+        if pending:
+            info(f'History saved {len(pending)} snapshots to {self.location("")}')
+
+    def close(self):
+        super().close()
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def __connect(self):
+        if self.__connection is None:
+            Path(self.directory).mkdir(parents=True, exist_ok=True)
+            self.__connection = connect(self.location(''), timeout=30)
+            self.__connection.executescript(
+                'CREATE TABLE IF NOT EXISTS snapshots (name TEXT NOT NULL, timestamp REAL NOT NULL, data TEXT NOT NULL);'
+                'CREATE INDEX IF NOT EXISTS snapshots_name_timestamp ON snapshots (name, timestamp DESC);'
+                'CREATE TABLE IF NOT EXISTS latencies (name TEXT PRIMARY KEY, data TEXT NOT NULL);'
+            )
+        return self.__connection
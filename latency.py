@@ -0,0 +1,35 @@
+class Latency:
+
+    def __init__(self, samples: list[float] = None, size: int = 50, minimum: int = 10):
+        self.size    = size
+        self.minimum = minimum
+        self.samples = list(samples or [])[-size:]
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        if len(self.samples) > self.size:
+            del self.samples[:len(self.samples) - self.size]
+
+    def percentile(self, quantile: float):
+        if len(self.samples) < self.minimum:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def moved(self, profile: dict | None, tolerance: float = 0.2):
+        if profile is None:
+            return True
+        for key, quantile in [('p50', 0.50), ('p99', 0.99)]:
+            current  = self.percentile(quantile)
+            recorded = profile.get(key)
+            if current is None or recorded is None or abs(current - recorded) > tolerance * recorded:
+                return True
+        return False
+
+    def profile(self):
+        return {
+            'p50':     self.percentile(0.50),
+            'p95':     self.percentile(0.95),
+            'p99':     self.percentile(0.99),
+            'samples': list(self.samples),
+        }
@@ -0,0 +1,79 @@
+from asyncio    import Lock, Semaphore, sleep
+from contextlib import asynccontextmanager
+from itertools  import chain, zip_longest
+from time       import monotonic
+from typing     import Callable, Iterable
+
+class Bucket:
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate     = rate
+        self.burst    = max(burst, 1)
+        self.__tokens = float(self.burst)
+        self.__update = monotonic()
+        self.__lock   = Lock()
+
+    async def acquire(self):
+        async with self.__lock:
+            while True:
+                now = monotonic()
+                self.__tokens = min(self.burst, self.__tokens + (now - self.__update) * self.rate)
+                self.__update = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                await sleep((1 - self.__tokens) / self.rate)
+
+
+class Limiter:
+
+    def __init__(self, limit: int = 50, limit_per_host: int = 0, rate_per_host: float = 0, burst_per_host: int = 1):
+        self.limit          = limit
+        self.limit_per_host = limit_per_host
+        self.rate_per_host  = rate_per_host
+        self.burst_per_host = burst_per_host
+        self.__global       = Semaphore(limit) if limit > 0 else None
+        self.__hosts:   dict[str, Semaphore] = {}
+        self.__buckets: dict[str, Bucket]    = {}
+
+    @asynccontextmanager
+    async def acquire(self, host: str):
+        host_semaphore = self.__host_semaphore(host)
+        if host_semaphore is not None:
+            await host_semaphore.acquire()
+        try:
+            bucket = self.__bucket(host)
+            if bucket is not None:
+                await bucket.acquire()
+            if self.__global is not None:
+                await self.__global.acquire()
+            try:
+                yield
+            finally:
+                if self.__global is not None:
+                    self.__global.release()
+        finally:
+            if host_semaphore is not None:
+                host_semaphore.release()
+
+    @staticmethod
+    def interleave(items: Iterable, key: Callable[[object], str]):
+        groups: dict[str, list] = {}
+        for item in items:
+            groups.setdefault(key(item), []).append(item)
+        missing = object()
+        return [item for item in chain.from_iterable(zip_longest(*groups.values(), fillvalue=missing)) if item is not missing]
+
+    def __host_semaphore(self, host: str):
+        if self.limit_per_host <= 0:
+            return None
+        if host not in self.__hosts:
+            self.__hosts[host] = Semaphore(self.limit_per_host)
+        return self.__hosts[host]
+
+    def __bucket(self, host: str):
+        if self.rate_per_host <= 0:
+            return None
+        if host not in self.__buckets:
+            self.__buckets[host] = Bucket(self.rate_per_host, self.burst_per_host)
+        return self.__buckets[host]
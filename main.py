@@ -1,9 +1,17 @@
-from asyncio     import gather, run
-from environment import Environment
-from logging     import basicConfig, DEBUG
-from request     import Request
-from rule        import Rule
-from trigger     import Trigger, Email as EmailAction, Request as RequestAction
+from asyncio            import gather, run
+from concurrent.futures import Executor, ProcessPoolExecutor
+from environment        import Environment
+from history            import History, FileHistory, SQLiteHistory
+from limiter            import Limiter
+from logging            import basicConfig, error, info, DEBUG
+from metrics            import metrics
+from multiprocessing    import get_context
+from request            import Request
+from rule               import Rule
+from scheduler          import Scheduler
+from session            import Session
+from shard              import Shard
+from trigger            import Dispatcher, Trigger, Email as EmailAction, Request as RequestAction
 
 basicConfig(
     level=DEBUG,
@@ -12,47 +20,113 @@ basicConfig(
 )
 
 async def main():
-    configs = Environment.analyze_env()
+    settings, configs = Environment.analyze()
 
-    tasks = []
-    for config in configs:
-        request = Request(
-            config['name'],
-            config['url'],
-            config['method'],
-            config['timeout'],
-            config['content_type'],
-            config['headers'],
-            config['body'],
-        )
-        trigger = Trigger(
-            config['trigger']['action'],
-            EmailAction(
-                config['trigger']['email']['username'],
-                config['trigger']['email']['password'],
-                config['trigger']['email']['receivers'],
-                config['trigger']['email']['subject'],
-                config['trigger']['email']['body'],
-                config['trigger']['email']['server'],
-                config['trigger']['email']['port'],
-            ),
-            RequestAction(
-                config['trigger']['request']['url'],
-                config['trigger']['request']['method'],
-                config['trigger']['request']['headers'],
-                config['trigger']['request']['body'],
-            ),
-        )
-        rule = Rule(
-            config['rule']['schema'],
-            config['rule']['logic'],
-            f'{config['result_dir']}/{config['name']}.json',
-            request,
-            trigger,
-        )
-        tasks.append(rule.perform())
+    shard   = Shard(settings['shard']['index'], settings['shard']['count'])
+    configs = shard.select(configs)
+    if shard.count > 1:
+        info(f'Shard {shard.index} of {shard.count} owns {len(configs)} requests')
+    executor = ProcessPoolExecutor(settings['worker_processes'], mp_context=get_context('spawn')) if settings['worker_processes'] > 0 else None
+    history  = build_history(settings['history'])
+    limiter = Limiter(
+        settings['limiter']['limit'],
+        settings['limiter']['limit_per_host'],
+        settings['limiter']['rate_per_host'],
+        settings['limiter']['burst_per_host'],
+    )
+    async with Session(
+        settings['session']['limit'],
+        settings['session']['limit_per_host'],
+        settings['session']['keepalive_timeout'],
+        settings['session']['dns_cache_ttl'],
+    ) as session:
+        async with Dispatcher(
+            session,
+            settings['trigger']['workers'],
+            settings['trigger']['queue_size'],
+            settings['trigger']['coalesce_window'],
+            settings['trigger']['state_file'],
+        ) as dispatcher:
+            rules = [build_rule(config, session, limiter, dispatcher, history, executor) for config in configs]
+            try:
+                match settings['mode']:
+                    case 'daemon':
+                        runner = await metrics.serve(settings['metrics']['port']) if settings['metrics']['port'] > 0 else None
+                        scheduler = Scheduler(history, settings['schedule']['jitter'])
+                        for config, rule in zip(configs, rules):
+                            scheduler.add(rule, config['interval'])
+                        try:
+                            await scheduler.run()
+                        finally:
+                            if runner is not None:
+                                await runner.cleanup()
+                    case 'oneshot':
+                        rules   = Limiter.interleave(rules, lambda rule: rule.request.host)
+                        results = await gather(*[rule.perform() for rule in rules], return_exceptions=True)
+                        for rule, result in zip(rules, results):
+                            if isinstance(result, BaseException):
+                                error(f'Request {rule.request.name} failed with {type(result).__name__}, {result}')
+            finally:
+                history.close()
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+        if settings['metrics']['textfile']:
+            metrics.dump(settings['metrics']['textfile'])
+        if settings['metrics']['pushgateway_url']:
+            await metrics.push(session.client, settings['metrics']['pushgateway_url'])
 
-    await gather(*tasks)
+def build_history(config: dict) -> History:
+    match config['backend']:
+        case 'file':
+            return FileHistory(config['directory'])
+        case 'sqlite':
+            return SQLiteHistory(config['directory'], config['retention_count'], config['retention_age'])
+
+def build_rule(config: dict, session: Session, limiter: Limiter, dispatcher: Dispatcher, history: History, executor: Executor = None):
+    request = Request(
+        config['name'],
+        config['url'],
+        config['method'],
+        config['timeout'],
+        config['content_type'],
+        config['headers'],
+        config['body'],
+        session,
+        limiter,
+        config['max_size'],
+        config['retries'],
+        config['hedge'],
+    )
+    trigger = Trigger(
+        config['trigger']['action'],
+        EmailAction(
+            config['trigger']['email']['username'],
+            config['trigger']['email']['password'],
+            config['trigger']['email']['receivers'],
+            config['trigger']['email']['subject'],
+            config['trigger']['email']['body'],
+            config['trigger']['email']['server'],
+            config['trigger']['email']['port'],
+            config['trigger']['email']['starttls'],
+        ),
+        RequestAction(
+            config['trigger']['request']['url'],
+            config['trigger']['request']['method'],
+            config['trigger']['request']['headers'],
+            config['trigger']['request']['body'],
+        ),
+        config['trigger']['cooldown'],
+        config['trigger']['deduplicate'],
+    )
+    return Rule(
+        config['rule']['schema'],
+        config['rule']['logic'],
+        history,
+        request,
+        trigger,
+        dispatcher,
+        executor,
+    )
 
 if __name__ == '__main__':
     run(main())
@@ -0,0 +1,156 @@
+from aiohttp    import ClientSession, TraceConfig, web
+from contextlib import contextmanager
+from logging    import info, error
+from os         import fdopen, replace
+from pathlib    import Path
+from tempfile   import mkstemp
+from time       import perf_counter
+from types      import SimpleNamespace
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labels: list[str]):
+        self.name     = name
+        self.help     = help
+        self.labels   = labels
+        self.__values: dict[tuple, float] = {}
+
+    def inc(self, value: float = 1, **labels: str):
+        key = tuple(labels[label] for label in self.labels)
+        self.__values[key] = self.__values.get(key, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in self.__values.items():
+            lines.append(f'{self.name}{Counter._format(self.labels, key)} {value}')
+        return lines
+
+    @staticmethod
+    def _format(labels: list[str], values: tuple, extra: str = ''):
+        pairs = [f'{label}="{value}"' for label, value in zip(labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, labels: list[str], buckets: tuple[float, ...]):
+        self.name     = name
+        self.help     = help
+        self.labels   = labels
+        self.buckets  = buckets
+        self.__values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(labels[label] for label in self.labels)
+        if key not in self.__values:
+            self.__values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = self.__values[key]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[0][index] += 1
+                break
+        counts[1] += value
+        counts[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, (counts, total, count) in self.__values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{Counter._format(self.labels, key, f'le="{bound}"')} {cumulative}')
+            lines.append(f'{self.name}_bucket{Counter._format(self.labels, key, 'le="+Inf"')} {count}')
+            lines.append(f'{self.name}_sum{Counter._format(self.labels, key)} {total}')
+            lines.append(f'{self.name}_count{Counter._format(self.labels, key)} {count}')
+        return lines
+
+
+class Metrics:
+
+    __buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.phases   = Histogram('httpdiff_phase_seconds', 'Duration of every phase of the request, rule and trigger pipeline', ['phase'], self.__buckets)
+        self.requests = Counter('httpdiff_requests_total', 'Performed requests by outcome', ['outcome'])
+        self.rules    = Counter('httpdiff_rules_total', 'Evaluated rules by result', ['result'])
+        self.history  = Counter('httpdiff_history_total', 'Results handed to history by result', ['result'])
+        self.triggers = Counter('httpdiff_triggers_total', 'Performed trigger actions by action and outcome', ['action', 'outcome'])
+
+    @contextmanager
+    def timer(self, phase: str):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.observe(perf_counter() - started, phase=phase)
+
+    def trace_config(self):
+        trace_config = TraceConfig(trace_config_ctx_factory=lambda trace_request_ctx: SimpleNamespace(marks={}))
+
+        def mark(name: str):
+            async def hook(session, context, parameters):
+                context.marks[name] = perf_counter()
+            return hook
+
+        def measure(phase: str, start: str):
+            async def hook(session, context, parameters):
+                if start in context.marks:
+                    self.phases.observe(perf_counter() - context.marks[start], phase=phase)
+            return hook
+
+        trace_config.on_request_start.append(mark('request'))
+        trace_config.on_connection_queued_start.append(mark('queue'))
+        trace_config.on_connection_queued_end.append(measure('pool_wait', 'queue'))
+        trace_config.on_dns_resolvehost_start.append(mark('dns'))
+        trace_config.on_dns_resolvehost_end.append(measure('dns', 'dns'))
+        trace_config.on_connection_create_start.append(mark('connect'))
+        trace_config.on_connection_create_end.append(measure('connect', 'connect'))
+        trace_config.on_request_headers_sent.append(mark('sent'))
+        trace_config.on_request_end.append(measure('time_to_first_byte', 'sent'))
+        return trace_config
+
+    def render(self):
+        lines = []
+        for metric in [self.phases, self.requests, self.rules, self.history, self.triggers]:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, port: int):
+        async def handle(request: web.Request):
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+        application = web.Application()
+        application.router.add_get('/metrics', handle)
+        runner = web.AppRunner(application, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, port=port).start()
+        info(f'Metrics served on port {port} at /metrics')
+        return runner
+
+    def dump(self, path: str):
+        file_path = Path(path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        descriptor, temporary_path = mkstemp(dir=file_path.parent, prefix=f'.{file_path.name}.', suffix='.tmp')
+        try:
+            with fdopen(descriptor, 'w') as temporary_file:
+                temporary_file.write(self.render())
+            Path(temporary_path).chmod(0o644)
+            replace(temporary_path, file_path)
+        except Exception:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
+        info(f'Metrics written to {path}')
+
+    async def push(self, session: ClientSession, url: str):
+        try:
+            async with session.put(f'{url.rstrip('/')}/metrics/job/httpdiff', data=self.render().encode(), headers={'Content-Type': 'text/plain; version=0.0.4'}) as response:
+                if response.status >= 400:
+                    raise Exception(f'status {response.status}')
+            info(f'Metrics pushed to {url}')
+        except Exception as exception:
+            error(f'Error when pushing metrics, {exception}')
+
+
+metrics = Metrics()
@@ -0,0 +1,119 @@
+from argparse           import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from datetime           import datetime, UTC
+from functools          import cache
+from history            import History, FileHistory, SQLiteHistory
+from json               import dumps, loads
+from multiprocessing    import get_context
+from os                 import getenv
+from schema             import Schema
+from sys                import stdout
+from time               import perf_counter
+
+@cache
+def open_history(backend: str, directory: str) -> History:
+    match backend:
+        case 'file':
+            return FileHistory(directory)
+        case 'sqlite':
+            return SQLiteHistory(directory)
+
+
+def replay(backend: str, directory: str, name: str, candidates: list[tuple[dict, str]], since: float, until: float, timeline: bool):
+    schemas  = [Schema(name, schema, logic) for schema, logic in candidates]
+    reports  = [{'fired': 0, 'skipped': 0, 'unsupported': 0, 'lower_bound': False, 'timeline': []} for _ in schemas]
+    previous = [None for _ in schemas]
+    count    = 0
+    for timestamp, current in open_history(backend, directory).series(name, since, until):
+        for index, (schema, report) in enumerate(zip(schemas, reports)):
+            if not schema.covers(current):
+                report['unsupported'] += 1
+                previous[index] = None
+                continue
+            fired, trace = schema.evaluate(current, previous[index])
+            if trace is None:
+                report['skipped'] += 1
+            elif fired:
+                report['fired'] += 1
+                if timeline:
+                    report['timeline'].append(datetime.fromtimestamp(timestamp, UTC).isoformat())
+            if not report['lower_bound'] and schema.evaluate(current, current)[0]:
+                report['lower_bound'] = True
+            previous[index] = current
+        count += 1
+    return name, count, reports
+
+
+def candidate(value: str):
+    if value.startswith('@'):
+        with open(value[1:]) as schema_file:
+            value = schema_file.read()
+    schema = loads(value)
+    if isinstance(schema, dict) and 'schema' in schema:
+        return schema['schema'], schema.get('logic', 'or')
+    return schema, None
+
+
+def timestamp(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse():
+    parser = ArgumentParser(description='Offline replay of candidate HttpDiff rule schemas over the recorded history')
+    parser.add_argument('--schema',    type=candidate, action='append', required=True, help="candidate rule schema as json, '@path' reads it from a file, repeat to compare candidates")
+    parser.add_argument('--logic',     choices=['or', 'and'], default='or', help='logic of candidates not given as {"schema": ..., "logic": ...}')
+    parser.add_argument('--names',     type=lambda value: [name for name in value.split(',') if name], help='comma separated requests, every request of the history by default')
+    parser.add_argument('--backend',   choices=['sqlite', 'file'], default=getenv('HTTP_DIFF_HISTORY_BACKEND', 'sqlite').lower())
+    parser.add_argument('--directory', default=getenv('HTTP_DIFF_RESULT_DIRECTORY', 'history'))
+    parser.add_argument('--since',     type=timestamp, default=0, help='first snapshot replayed, unix timestamp or iso date')
+    parser.add_argument('--until',     type=timestamp, default=float('inf'), help='last snapshot replayed, unix timestamp or iso date')
+    parser.add_argument('--workers',   type=int, default=0, help='processes replaying requests in parallel, 0 (default) replays in this process')
+    parser.add_argument('--timeline',  action='store_true', help='list the timestamp of every firing in the report')
+    parser.add_argument('--output',    default='-', help="path of the json report, '-' for stdout")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments  = parse()
+    candidates = [(schema, logic or arguments.logic) for schema, logic in arguments.schema]
+    names      = arguments.names or open_history(arguments.backend, arguments.directory).names()
+    for schema, logic in candidates:
+        Schema('replay', schema, logic)
+    started = perf_counter()
+    jobs    = [(arguments.backend, arguments.directory, name, candidates, arguments.since, arguments.until, arguments.timeline) for name in names]
+    if arguments.workers > 0:
+        with ProcessPoolExecutor(arguments.workers, mp_context=get_context('spawn')) as executor:
+            results = list(executor.map(replay, *zip(*jobs), chunksize=max(1, len(jobs) // (arguments.workers * 4)))) if jobs else []
+    else:
+        results = [replay(*job) for job in jobs]
+    report = {
+        'backend':    arguments.backend,
+        'directory':  arguments.directory,
+        'requests':   len(names),
+        'snapshots':  sum(count for _, count, _ in results),
+        'seconds':    perf_counter() - started,
+        'candidates': [],
+    }
+    for index, (schema, logic) in enumerate(candidates):
+        targets = {}
+        for name, count, reports in results:
+            targets[name] = {'snapshots': count, 'pairs': max(count - 1, 0), **reports[index]}
+            if not arguments.timeline:
+                del targets[name]['timeline']
+        report['candidates'].append({
+            'schema':      schema,
+            'logic':       logic,
+            'fired':       sum(target['fired'] for target in targets.values()),
+            'firing':      sorted(name for name, target in targets.items() if target['fired']),
+            'unsupported': sorted(name for name, target in targets.items() if target['unsupported']),
+            'lower_bound': sorted(name for name, target in targets.items() if target['lower_bound']),
+            'requests':    targets,
+        })
+    if arguments.output == '-':
+        stdout.write(dumps(report, indent=4) + '\n')
+    else:
+        with open(arguments.output, 'w') as output:
+            output.write(dumps(report, indent=4) + '\n')
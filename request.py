@@ -1,9 +1,46 @@
-from aiohttp import ClientSession, ClientResponse, ClientTimeout
-from logging import info
+from aiohttp import ClientConnectionError, ClientConnectorError, ClientSession, ClientResponse, ClientSSLError, ClientTimeout, ConnectionTimeoutError
+from asyncio import FIRST_COMPLETED, create_task, sleep, wait
+from codecs  import lookup
+from contextlib import nullcontext
+from hashlib import blake2b
+from latency import Latency
+from limiter import Limiter
+from logging import info, warning
+from metrics import metrics
+from random  import uniform
+from session import Session
+from time    import perf_counter
+from yarl    import URL
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 
 class Request:
 
-    def __init__(self, name: str, url: str, method: str = 'post', timeout: int = 5, content_type: str = 'application/json', headers: dict[str, str] = {}, body: dict[str, str] = {}):
+    __missing = object()
+
+    __chunk_size = 65536
+
+    __idempotent = ['GET', 'PUT', 'DELETE']
+
+    __timeout_factor = 3
+
+    __timeout_floor = 1.0
+
+    __backoff = 0.5
+
+    __backoff_cap = 5.0
+
+    __hedge_floor = 0.05
+
+    __validators = {
+        'etag':          ('ETag',          'If-None-Match'),
+        'last_modified': ('Last-Modified', 'If-Modified-Since'),
+    }
+
+    def __init__(self, name: str, url: str, method: str = 'post', timeout: int = 5, content_type: str = 'application/json', headers: dict[str, str] = {}, body: dict[str, str] = {}, session: Session = None, limiter: Limiter = None, max_size: int = 10485760, retries: int = 2, hedge: bool = False, latency: Latency = None):
         self.name         = name
         self.url          = url
         self.timeout      = timeout
@@ -11,42 +48,229 @@ class Request:
         self.content_type = content_type
         self.headers      = headers
         self.body         = body
+        self.session      = session
+        self.limiter      = limiter
+        self.max_size     = max_size
+        self.retries      = retries
+        self.hedge        = hedge
+        self.latency      = latency or Latency()
+        self.host         = URL(url).host or ''
 
-    async def perform(self):
-        async with ClientSession() as session:
-            info(f'Request {self.name}: started')
-            timeout = ClientTimeout(total=self.timeout)
-            match self.content_type:
-                case 'application/json':
-                    async with session.request(url=self.url, method=self.method, headers=self.headers, json=self.body, timeout=timeout) as response:
-                        return await self.__get_dict_response(response)
-                case 'application/x-www-form-urlencoded':
-                    async with session.request(url=self.url, method=self.method, headers=self.headers, data=self.body, timeout=timeout) as response:
-                        return await self.__get_dict_response(response)
-
-    async def __get_dict_response(self, response: ClientResponse):
-        info(f'Request {self.name}: finished')
-        content_type = 'json'
+    async def perform(self, validators: dict[str, str] = None):
+        headers = self.__conditional_headers(validators)
+        try:
+            result = await self.__open(headers)
+        except Exception:
+            metrics.requests.inc(outcome='error')
+            raise
+        metrics.requests.inc(outcome='not_modified' if result['status'] == 304 else 'success')
+        return result
+
+    @staticmethod
+    def not_modified(response: dict, previous: dict | None):
+        return response['status'] == 304 and previous is not None and 'digest' in previous and bool(previous.get('validators'))
+
+    def __conditional_headers(self, validators: dict[str, str] | None):
+        if self.method != 'GET' or not validators:
+            return self.headers
+        conditions = {header: validators[key] for key, (_, header) in self.__validators.items() if validators.get(key)}
+        return {**conditions, **self.headers}
+
+    async def __open(self, headers: dict[str, str]):
+        if self.session is None:
+            async with ClientSession(trace_configs=[metrics.trace_config()]) as session:
+                return await self.__retry(session, headers)
+        return await self.__retry(self.session.client, headers)
+
+    async def __retry(self, session: ClientSession, headers: dict[str, str]):
+        attempt = 0
+        while True:
+            last    = attempt >= self.retries
+            timeout = self.__timeout(last)
+            try:
+                return await self.__hedge(session, headers, timeout)
+            except Exception as exception:
+                if last or not self.__retryable(exception, timeout):
+                    raise
+                delay = min(self.__backoff_cap, self.__backoff * 2 ** attempt) * uniform(0.5, 1)
+                warning(f'Request {self.name}: attempt {attempt + 1} failed with {type(exception).__name__}, retrying in {delay:.2f}s')
+                metrics.requests.inc(outcome='retry')
+                await sleep(delay)
+                attempt = attempt + 1 if Request.__unsent(exception) else self.retries
+
+    async def __hedge(self, session: ClientSession, headers: dict[str, str], timeout: ClientTimeout):
+        expected = self.latency.percentile(0.95) if self.hedge and self.method == 'GET' else None
+        if expected is None:
+            return await self.__measure(session, headers, timeout)
+        delay = max(self.__hedge_floor, expected)
+        tasks = {create_task(self.__measure(session, headers, timeout))}
+        done, _ = await wait(tasks, timeout=delay)
+        if not done:
+            info(f'Request {self.name}: slower than {delay:.3f}s, hedged')
+            metrics.requests.inc(outcome='hedge')
+            tasks.add(create_task(self.__measure(session, headers, timeout)))
         try:
-            body = await response.json()
-        except:
-            body = await response.text()
-            content_type = 'text'
+            while True:
+                done, _ = await wait(tasks, return_when=FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None or not tasks:
+                        return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __measure(self, session: ClientSession, headers: dict[str, str], timeout: ClientTimeout):
+        async with self.__slot():
+            started = perf_counter()
+            try:
+                result = await self.__send(session, headers, timeout)
+            except TimeoutError:
+                self.latency.observe(perf_counter() - started)
+                raise
+            self.latency.observe(perf_counter() - started)
+            return result
+
+    def __slot(self):
+        if self.limiter is None:
+            return nullcontext()
+        return self.limiter.acquire(self.host)
+
+    def __timeout(self, last: bool):
+        expected = self.latency.percentile(0.99)
+        if last or expected is None:
+            return ClientTimeout(total=self.timeout)
+        adaptive = max(self.__timeout_floor, expected * self.__timeout_factor)
+        if adaptive >= self.timeout:
+            return ClientTimeout(total=self.timeout)
+        return ClientTimeout(total=self.timeout, sock_connect=adaptive, sock_read=adaptive)
+
+    def __retryable(self, exception: Exception, timeout: ClientTimeout):
+        if isinstance(exception, ClientSSLError):
+            return False
+        if Request.__unsent(exception):
+            return True
+        return self.method in self.__idempotent and timeout.sock_read is not None and isinstance(exception, (ClientConnectionError, TimeoutError))
+
+    @staticmethod
+    def __unsent(exception: Exception):
+        return isinstance(exception, (ClientConnectorError, ConnectionTimeoutError))
+
+    async def __send(self, session: ClientSession, headers: dict[str, str], timeout: ClientTimeout):
+        info(f'Request {self.name}: started')
+        match self.content_type:
+            case 'application/json':
+                async with session.request(url=self.url, method=self.method, headers=headers, json=self.body, timeout=timeout) as response:
+                    return await self.__get_raw_response(response)
+            case 'application/x-www-form-urlencoded':
+                async with session.request(url=self.url, method=self.method, headers=headers, data=self.body, timeout=timeout) as response:
+                    return await self.__get_raw_response(response)
+
+    async def __get_raw_response(self, response: ClientResponse):
+        with metrics.timer('download'):
+            body, size, hash = await self.__read(response)
+        info(f'Request {self.name}: finished')
+        if hash is not None:
+            warning(f'Request {self.name}: body of {size} bytes exceeds {self.max_size} bytes, only its hash is kept')
         return {
-            'status':  response.status,
-            'headers': self.__flatten_dict(dict(response.headers)),
-            'body':    self.__flatten_dict(body) if content_type == 'json' else body,
+            'status':       response.status,
+            'headers':      dict(response.headers),
+            'content_type': response.content_type,
+            'charset':      response.charset,
+            'body':         body,
+            'size':         size,
+            'hash':         hash,
+            'validators':   {key: response.headers[header] for key, (header, _) in self.__validators.items() if header in response.headers},
         }
 
-    def __flatten_dict(self, data: dict, parent_key: str = '', seperator: str = '.'):
+    async def __read(self, response: ClientResponse):
+        body   = bytearray()
+        size   = 0
+        hasher = None
+        async for chunk in response.content.iter_chunked(self.__chunk_size):
+            size += len(chunk)
+            if hasher is None and (self.max_size <= 0 or size <= self.max_size):
+                body.extend(chunk)
+                continue
+            if hasher is None:
+                hasher = blake2b(body, digest_size=16)
+                body   = bytearray()
+            hasher.update(chunk)
+        return bytes(body), size, hasher.hexdigest() if hasher is not None else None
+
+    @staticmethod
+    def decode(response: dict, selection: dict[str, set[str] | None] = None, timings: dict[str, float] = None):
+        if selection is None:
+            selection = {'headers': None, 'body': None}
+        if timings is None:
+            timings = {}
+        started = perf_counter()
+        content_type, body = Request.__parse(response)
+        parsed = perf_counter()
+        result = {
+            'status':     response['status'],
+            'headers':    Request.__select_dict(response['headers'], selection['headers']),
+            'body':       Request.__select_dict(body, selection['body']) if content_type == 'json' else body,
+            'validators': response['validators'],
+        }
+        timings['parse']   = parsed - started
+        timings['extract'] = perf_counter() - parsed
+        return result
+
+    @staticmethod
+    def __parse(response: dict):
+        if response['hash'] is not None:
+            return 'hash', {'size': response['size'], 'hash': response['hash']}
+        try:
+            charset = lookup(response['charset'] or 'utf-8').name
+        except LookupError:
+            charset = 'utf-8'
+        if response['content_type'] == 'application/json' or response['content_type'].endswith('+json'):
+            if not response['body'].strip():
+                return 'json', None
+            try:
+                return 'json', loads(response['body'] if charset == 'utf-8' else response['body'].decode(charset))
+            except ValueError:
+                pass
+        return 'text', response['body'].decode(charset, errors='replace')
+
+    @staticmethod
+    def __select_dict(data: dict | list, paths: set[str] | None):
+        if paths is None or not isinstance(data, dict):
+            return Request.__flatten_dict(data) if isinstance(data, dict) else data
+        items = {}
+        for path in paths:
+            value = Request.__extract(data, path.split('.'))
+            if value is Request.__missing:
+                return Request.__flatten_dict(data)
+            items[path] = value
+        return items
+
+    @staticmethod
+    def __extract(data: object, parts: list[str]):
+        if not parts:
+            return Request.__missing if isinstance(data, (dict, list)) else data
+        if isinstance(data, dict):
+            for index in range(len(parts), 0, -1):
+                key = '.'.join(parts[:index])
+                if key in data:
+                    value = Request.__extract(data[key], parts[index:])
+                    if value is not Request.__missing:
+                        return value
+        elif isinstance(data, list) and parts[0].isdigit() and int(parts[0]) < len(data):
+            return Request.__extract(data[int(parts[0])], parts[1:])
+        return Request.__missing
+
+    @staticmethod
+    def __flatten_dict(data: dict, parent_key: str = '', seperator: str = '.'):
         items = {}
         for key, value in data.items():
             new_key = f'{parent_key}{seperator}{key}' if parent_key else key
             if isinstance(value, dict):
-                items.update(self.__flatten_dict(value, new_key, seperator))
+                items.update(Request.__flatten_dict(value, new_key, seperator))
             elif isinstance(value, list):
                 for index, element in enumerate(value):
-                    items.update(self.__flatten_dict({str(index): element}, new_key, seperator))
+                    items.update(Request.__flatten_dict({str(index): element}, new_key, seperator))
             else:
                 items[new_key] = value
         return items
@@ -1,152 +1,126 @@
-from json    import dumps, loads
-from logging import info, warning
-from pathlib import Path
-from request import Request
-from trigger import Trigger
+from asyncio            import get_running_loop
+from concurrent.futures import Executor
+from context            import Context
+from history            import History
+from latency            import Latency
+from logging            import info, warning
+from metrics            import metrics
+from request            import Request
+from schema             import Schema
+from time               import perf_counter
+from trigger            import Dispatcher, Trigger
 
 class Rule:
 
-    __information = {}
+    __schemas: dict[str, Schema] = {}
 
-    def __init__(self, schema: dict, logic: str, result_file: str, request: Request, trigger: Trigger):
+    def __init__(self, schema: dict, logic: str, history: History, request: Request, trigger: Trigger, dispatcher: Dispatcher, executor: Executor = None):
         self.schema      = schema
         self.logic       = logic
-        self.result_file = result_file
+        self.history     = history
         self.request     = request
         self.trigger     = trigger
-
-        self.__information['request.name']         = self.request.name
-        self.__information['request.url']          = self.request.url
-        self.__information['request.method']       = self.request.method
-        self.__information['request.timeout']      = self.request.timeout
-        self.__information['request.content_type'] = self.request.content_type
-        self.__information['rule.logic']           = self.logic
-        self.__information['rule.result_file']     = self.result_file
+        self.dispatcher  = dispatcher
+        self.executor    = executor
+        self.__previous  = None
+        self.__loaded    = False
+        self.__latency   = None
+        self.__schema    = Rule.__compile(self.request.name, self.schema, self.logic)
 
     async def perform(self):
-        result = await self.request.perform()
-        condition = self.__orchestrate(result)
-        if not self.__determine_result(condition, self.logic):
+        previous  = self.__load_previous()
+        covered   = previous if previous is not None and self.__schema.covers(previous) else None
+        try:
+            response = await self.request.perform(covered.get('validators') if covered is not None else None)
+        except Exception:
+            self.__save_latency(False)
+            raise
+        arguments = (self.request.name, self.schema, self.logic, response, previous)
+        eager     = self.executor is not None and not Request.not_modified(response, covered)
+        if eager:
+            result, fired, skipped, information, timings = await get_running_loop().run_in_executor(self.executor, Rule.evaluate, *arguments, True)
+        else:
+            result, fired, skipped, information, timings = Rule.evaluate(*arguments)
+        for phase, seconds in timings.items():
+            metrics.phases.observe(seconds, phase=phase)
+        metrics.rules.inc(result='fired' if fired else 'skipped' if skipped else 'quiet')
+        if not fired:
             info(f'Request {self.request.name} does not satisfy the condition, trigger aborted')
+            if not skipped:
+                self.dispatcher.recover(self.trigger, self.request.name)
         else:
             warning(f'Request {self.request.name} satisfy the condition')
-            self.trigger.perform(self.__information)
-        self.__save_result_file(result)
-
-    def __orchestrate(self, result: dict):
-        condition = []
-        if 'status' in self.schema:
-            condition.append(self.__scan_status(self.schema['status'], result))
-        if 'headers' in self.schema:
-            headers_result = self.__information['rule.headers.final'] = self.__scan_key_value(self.schema['headers'], result, 'headers')
-            condition.append(headers_result)
-        if 'body' in self.schema:
-            body_result = self.__information['rule.body.final'] = self.__scan_key_value(self.schema['body'], result, 'body')
-            condition.append(body_result)
-        return condition
-    
-    def __scan_operator(self, config: dict):
-        if 'source' not in config and 'operator' not in config and 'destination' not in config:
-            raise KeyError(f"Config {config} type doesn't have 'source', 'operator' or 'destination', can't perform comparation")
-
-    def __scan_status(self, config: dict, result: dict):
-        self.__scan_operator(config)
-        source = self.__information['rule.status.source'] = config['source']
-        if source == '[current_status]':
-            source = self.__information['rule.status.source.value'] = result['status']
-        elif source == '[previous_status]':
-            if not self.__check_result_file():
-                self.__save_result_file(result)
-                return 'skip'
-            source = self.__information['rule.status.source.value']= self.__load_result_file()['status']
-        elif not isinstance(source, int):
-            raise ValueError(f'Source {source} of {self.request.name} request must be an integer')
-
-        destination = self.__information['rule.status.destination'] = config['destination']
-        if destination == '[current_status]':
-            destination = self.__information['rule.status.destination.value'] = result['status']
-        elif destination == '[previous_status]':
-            if not self.__check_result_file():
-                self.__save_result_file(result)
-                return 'skip'
-            destination = self.__information['rule.status.destination.value'] = self.__load_result_file()['status']
-        elif not isinstance(source, int):
-            raise ValueError(f'Destination {destination} of {self.request.name} request must be an integer')
-        operator = self.__information['rule.status.operator'] = config['operator']
-        if operator == 'similar':
-            similar_result = self.__information['rule.status.operator.value'] = source == destination
-            return similar_result
-        elif operator == 'different':
-            different_result = self.__information['rule.status.operator.value'] = source != destination
-            return different_result
-        return False
-
-    def __scan_key_value(self, config: dict[str, str | list[dict]], result: dict, type: str):
-        final_condition = []
-        self.__information[f'rule.{type}.logic'] = config['logic']
-        for index, condition in enumerate(config['conditions']):
-            self.__scan_operator(condition)
-            source = condition['source'].split('@', 1)
-            self.__information[f'rule.{type}.{index}.source'] = source[0]
-            tmp_source = None
-            if source[0] == f'[previous_{type}]':
-                if not self.__check_result_file():
-                    self.__save_result_file(result)
-                    return 'skip'
-                tmp_source = self.__load_result_file()[type]
-            elif source[0] == f'[current_{type}]':
-                tmp_source = result[type]
-            else:
-                raise ValueError(f"Config {config} of source at {index} must be in ['previous_{type}', 'current_{type}']")
-            if len(source) == 2 and source[1] in tmp_source:
-                tmp_source = tmp_source[source[1]]
-            source = self.__information[f'rule.{type}.{index}.source.value'] = tmp_source
-
-            destination = condition['destination'].split('@', 1)
-            self.__information[f'rule.{type}.{index}.destination'] = destination[0]
-            tmp_destination = None
-            if destination[0] == f'[previous_{type}]':
-                if not self.__check_result_file():
-                    self.__save_result_file(result)
-                    return 'skip'
-                tmp_destination = self.__load_result_file()[type]
-            elif destination[0] == f'[current_{type}]':
-                tmp_destination = result[type]
+            context = Context({
+                'request.name':         self.request.name,
+                'request.url':          self.request.url,
+                'request.method':       self.request.method,
+                'request.timeout':      self.request.timeout,
+                'request.content_type': self.request.content_type,
+                'rule.logic':           self.logic,
+            }, {
+                'rule.result_file':     lambda: self.history.location(self.request.name),
+            })
+            if eager:
+                context.set(information)
             else:
-                raise ValueError(f"Config {config} of destination at {index} must be in ['previous_{type}', 'current_{type}']")
-            if len(destination) == 2 and destination[1] in tmp_destination:
-                tmp_destination = tmp_destination[destination[1]]
-            destination = self.__information[f'rule.{type}.{index}.destination.value'] = tmp_destination
-
-            operator = self.__information[f'rule.{type}.{index}.operator'] = condition['operator']
-            if operator == 'similar':
-                similar_result = self.__information[f'rule.{type}.{index}.operator.value'] = source == destination
-                final_condition.append(similar_result)
-            elif operator == 'different':
-                different_result = self.__information[f'rule.{type}.{index}.operator.value'] = source != destination
-                final_condition.append(different_result)
-            else:
-                final_condition.append(False)
-
-        return self.__determine_result(final_condition, config['logic'])
-
-    def __check_result_file(self):
-        return Path(self.result_file).exists()
-
-    def __save_result_file(self, data: dict):
-        file_path = Path(self.result_file)
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_path.write_text(dumps(data, indent=4, ensure_ascii=True))
-
-    def __load_result_file(self):
-        return loads(Path(self.result_file).read_text())
-
-    def __determine_result(self, result: list[str | bool], logic: str):
-        if 'skip' in result:
-            return False
-        match logic:
-            case 'and':
-                return False if False in result else True
-            case 'or':
-                return True if True in result else False
-        return False
+                context.defer(information)
+            await self.dispatcher.submit(self.trigger, context)
+        if Schema.unchanged(result, previous) and result['validators'] == previous.get('validators') and result['selection'] == previous.get('selection'):
+            info(f'Request {self.request.name} response is unchanged, history write skipped')
+            metrics.history.inc(result='unchanged')
+            self.__save_latency(False)
+            return
+        metrics.history.inc(result='saved')
+        self.__save_result(result)
+        self.__save_latency(True)
+
+    @staticmethod
+    def evaluate(name: str, schema: dict, logic: str, response: dict, previous: dict | None, eager: bool = False):
+        compiled = Rule.__compile(name, schema, logic)
+        timings  = {}
+        if previous is not None and not compiled.covers(previous):
+            info(f'Request {name} previous snapshot misses paths selected by the schema, reseeded')
+            previous = None
+        if Request.not_modified(response, previous):
+            result = {key: previous[key] for key in ['status', 'headers', 'body', 'digest', 'validators']}
+            result['selection'] = previous.get('selection')
+        else:
+            result  = Request.decode(response, compiled.selection, timings)
+            started = perf_counter()
+            result['digest']    = compiled.digest(result)
+            result['selection'] = compiled.extraction
+            timings['digest']   = perf_counter() - started
+        started = perf_counter()
+        fired, trace = compiled.evaluate(result, previous)
+        timings['rule'] = perf_counter() - started
+        information = {} if not fired else Schema.information(trace, result, previous) if eager else Schema.deferred(trace, result, previous)
+        return result, fired, trace is None, information, timings
+
+    @staticmethod
+    def __compile(name: str, schema: dict, logic: str):
+        compiled = Rule.__schemas.get(name)
+        if compiled is None or compiled.schema != schema or compiled.logic != logic:
+            compiled = Rule.__schemas[name] = Schema(name, schema, logic)
+        return compiled
+
+    def __load_previous(self):
+        if not self.__loaded:
+            with metrics.timer('history_load'):
+                self.__previous = self.history.load(self.request.name)
+                profile = self.history.load_latency(self.request.name)
+            if profile is not None:
+                self.request.latency = Latency(profile['samples'])
+            self.__latency  = profile
+            self.__loaded   = True
+        return self.__previous
+
+    def __save_latency(self, saved: bool):
+        if not saved and not self.request.latency.moved(self.__latency):
+            return
+        self.__latency = self.request.latency.profile()
+        self.history.save_latency(self.request.name, self.__latency)
+
+    def __save_result(self, data: dict):
+        self.history.save(self.request.name, data)
+        self.__previous = data
+        self.__loaded   = True
@@ -0,0 +1,73 @@
+from asyncio import Event, Task, TimeoutError, create_task, gather, get_running_loop, wait_for
+from heapq   import heappop, heappush
+from logging import info, error, warning
+from random  import uniform
+from signal  import SIGINT, SIGTERM
+from time    import monotonic
+from history import History
+from rule    import Rule
+
+class Scheduler:
+
+    def __init__(self, history: History, jitter: float = 0.1):
+        self.history    = history
+        self.jitter     = jitter
+        self.__timers:  list[tuple[float, int, Rule, float]] = []
+        self.__running: dict[Rule, Task] = {}
+        self.__stopped  = Event()
+        self.__sequence = 0
+
+    def add(self, rule: Rule, interval: float):
+        if interval <= 0:
+            raise ValueError(f'Interval of {rule.request.name} request must be greater than 0')
+        self.__push(monotonic() + uniform(0, interval * self.jitter), rule, interval)
+
+    def stop(self):
+        if not self.__stopped.is_set():
+            info('Scheduler received stop signal')
+            self.__stopped.set()
+
+    async def run(self):
+        loop = get_running_loop()
+        for signal in (SIGTERM, SIGINT):
+            loop.add_signal_handler(signal, self.stop)
+        try:
+            if not self.__timers:
+                warning('Scheduler has no request to run, idle until stopped')
+                await self.__stopped.wait()
+            while self.__timers and not self.__stopped.is_set():
+                due, _, rule, interval = self.__timers[0]
+                delay = due - monotonic()
+                if delay > 0:
+                    self.history.flush()
+                    try:
+                        await wait_for(self.__stopped.wait(), delay)
+                    except TimeoutError:
+                        pass
+                    continue
+                heappop(self.__timers)
+                self.__spawn(rule)
+                self.__push(max(due + interval * uniform(1 - self.jitter, 1 + self.jitter), monotonic()), rule, interval)
+            info('Scheduler stopped, waiting for running requests')
+            await gather(*self.__running.values(), return_exceptions=True)
+        finally:
+            for signal in (SIGTERM, SIGINT):
+                loop.remove_signal_handler(signal)
+
+    def __push(self, due: float, rule: Rule, interval: float):
+        self.__sequence += 1
+        heappush(self.__timers, (due, self.__sequence, rule, interval))
+
+    def __spawn(self, rule: Rule):
+        if rule in self.__running:
+            warning(f'Request {rule.request.name} is still running, tick skipped')
+            return
+        task = create_task(self.__perform(rule))
+        self.__running[rule] = task
+        task.add_done_callback(lambda _: self.__running.pop(rule, None))
+
+    async def __perform(self, rule: Rule):
+        try:
+            await rule.perform()
+        except Exception as exception:
+            error(f'Request {rule.request.name} failed with {type(exception).__name__}, {exception}')
@@ -0,0 +1,200 @@
+from hashlib  import blake2b
+from json     import dumps
+from operator import eq, ne
+from typing   import Callable
+
+Getter    = Callable[[dict, dict | None], object]
+Predicate = Callable[[dict, dict | None], tuple]
+
+class Schema:
+
+    __operators = {
+        'similar':   eq,
+        'different': ne,
+    }
+
+    __logics = ['and', 'or']
+
+    __types = ['status', 'headers', 'body']
+
+    def __init__(self, name: str, schema: dict, logic: str):
+        self.name           = name
+        self.schema         = schema
+        self.logic          = logic
+        self.needs_previous = False
+        self.selection: dict[str, set[str] | None] = {'headers': set(), 'body': set()}
+        if not isinstance(schema, dict):
+            raise ValueError(f'Schema of {self.name} request must be a json object')
+        if logic not in self.__logics:
+            raise ValueError(f'Logic {logic} of {self.name} request must be in {self.__logics}')
+        for type in schema:
+            if type not in self.__types:
+                raise KeyError(f'Schema of {self.name} request has unknown type {type}, must be in {self.__types}')
+        self.__sections = [self.__compile_section(type, schema[type]) for type in self.__types if type in schema]
+        self.extraction = {type: None if paths is None else sorted(paths) for type, paths in self.selection.items()}
+
+    def covers(self, snapshot: dict):
+        recorded = snapshot.get('selection') if 'digest' in snapshot else {'headers': None, 'body': None}
+        if recorded is None:
+            return False
+        for type, paths in self.selection.items():
+            if recorded.get(type, []) is None:
+                continue
+            if paths is None or not paths.issubset(recorded.get(type, [])):
+                return False
+        return True
+
+    def evaluate(self, current: dict, previous: dict | None):
+        if self.needs_previous and previous is None:
+            return False, None
+        trace = []
+        for type, logic, predicates in self.__sections:
+            conditions = [predicate(current, previous) for predicate in predicates]
+            final = conditions[0][5] if logic is None else self.determine([condition[5] for condition in conditions], logic)
+            trace.append((type, logic, conditions, final))
+        return self.determine([section[3] for section in trace], self.logic), trace
+
+    @staticmethod
+    def information(trace: list[tuple], current: dict, previous: dict | None):
+        return {key: resolve() for key, resolve in Schema.deferred(trace, current, previous).items()}
+
+    @staticmethod
+    def deferred(trace: list[tuple], current: dict, previous: dict | None):
+        information = {}
+        for type, logic, conditions, final in trace:
+            prefixes = [f'rule.{type}'] if logic is None else [f'rule.{type}.{index}' for index in range(len(conditions))]
+            if logic is not None:
+                information[f'rule.{type}.logic'] = lambda logic=logic: logic
+                information[f'rule.{type}.final'] = lambda final=final: final
+            for prefix, (source, source_getter, destination, destination_getter, operator, operator_value) in zip(prefixes, conditions):
+                information[f'{prefix}.source']            = lambda source=source: source
+                information[f'{prefix}.source.value']      = lambda getter=source_getter: getter(current, previous)
+                information[f'{prefix}.destination']       = lambda destination=destination: destination
+                information[f'{prefix}.destination.value'] = lambda getter=destination_getter: getter(current, previous)
+                information[f'{prefix}.operator']          = lambda operator=operator: operator
+                information[f'{prefix}.operator.value']    = lambda operator_value=operator_value: operator_value
+        return information
+
+    def digest(self, result: dict):
+        digest = {type: self.__hash(result[type]) for type in self.__types}
+        digest['all']   = self.__hash([digest[type] for type in self.__types])
+        digest['paths'] = {
+            type: {path: self.__hash(result[type][path]) for path in paths if isinstance(result[type], dict) and path in result[type]}
+            for type, paths in self.selection.items() if paths
+        }
+        return digest
+
+    @staticmethod
+    def unchanged(current: dict, previous: dict | None):
+        return previous is not None and 'digest' in previous and previous['digest']['all'] == current['digest']['all']
+
+    @staticmethod
+    def determine(result: list[bool], logic: str):
+        match logic:
+            case 'and':
+                return False not in result
+            case 'or':
+                return True in result
+        return False
+
+    def __compile_section(self, type: str, config: dict):
+        if type == 'status':
+            return type, None, [self.__compile_condition(config, type, f'{type}')]
+        if not isinstance(config, dict) or 'conditions' not in config:
+            raise KeyError(f"Config {config} of {self.name} request doesn't have 'conditions'")
+        logic = config.get('logic')
+        if logic not in self.__logics:
+            raise ValueError(f'Logic {logic} of {type} in {self.name} request must be in {self.__logics}')
+        conditions = [self.__compile_condition(condition, type, f'{type} condition {index}') for index, condition in enumerate(config['conditions'])]
+        return type, logic, conditions
+
+    def __compile_condition(self, config: dict, type: str, position: str) -> Predicate:
+        if not isinstance(config, dict) or 'source' not in config or 'operator' not in config or 'destination' not in config:
+            raise KeyError(f"Config {config} of {self.name} request doesn't have 'source', 'operator' or 'destination', can't perform comparation")
+        operator = config['operator']
+        if operator not in self.__operators:
+            raise ValueError(f'Operator {operator} of {position} in {self.name} request must be in {list(self.__operators)}')
+        source_label,      source      = self.__compile_operand(config['source'], type, f'Source of {position}')
+        destination_label, destination = self.__compile_operand(config['destination'], type, f'Destination of {position}')
+        compare = self.__operators[operator]
+        same    = self.__compile_same(type, config['source'], config['destination'])
+        settled = compare(None, None)
+
+        def predicate(current: dict, previous: dict | None):
+            if same is not None and same(current, previous):
+                return source_label, source, destination_label, destination, operator, settled
+            return source_label, source, destination_label, destination, operator, compare(source(current, previous), destination(current, previous))
+
+        return predicate
+
+    @staticmethod
+    def __compile_same(type: str, source: object, destination: object):
+        if type == 'status' or not isinstance(source, str) or not isinstance(destination, str):
+            return None
+        source_token,      _, source_path      = source.partition('@')
+        destination_token, _, destination_path = destination.partition('@')
+        if source_token == destination_token or source_path != destination_path or ('@' in source) != ('@' in destination):
+            return None
+        if '@' not in source:
+            return lambda current, previous: Schema.__same_digest(current, previous, type, None)
+        return lambda current, previous: Schema.__same_digest(current, previous, type, source_path)
+
+    @staticmethod
+    def __same_digest(current: dict, previous: dict, type: str, path: str | None):
+        if 'digest' not in current or 'digest' not in previous:
+            return False
+        current_digest, previous_digest = current['digest'], previous['digest']
+        if current_digest['all'] == previous_digest['all']:
+            return True
+        if path is None:
+            return current_digest[type] == previous_digest[type]
+        current_path  = current_digest['paths'].get(type, {}).get(path)
+        previous_path = previous_digest['paths'].get(type, {}).get(path)
+        return current_path is not None and current_path == previous_path
+
+    @staticmethod
+    def __hash(value: object):
+        return blake2b(dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode(), digest_size=16).hexdigest()
+
+    def __compile_operand(self, value: object, type: str, position: str) -> tuple[object, Getter]:
+        if type == 'status':
+            if value == '[current_status]':
+                return value, lambda current, previous: current['status']
+            if value == '[previous_status]':
+                self.needs_previous = True
+                return value, lambda current, previous: previous['status']
+            if not isinstance(value, int):
+                raise ValueError(f'{position} {value} of {self.name} request must be an integer')
+            return value, lambda current, previous: value
+        if not isinstance(value, str):
+            raise ValueError(f"{position} {value} of {self.name} request must be in ['[previous_{type}]', '[current_{type}]']")
+        token, _, path = value.partition('@')
+        if token == f'[current_{type}]':
+            scope = 'current'
+        elif token == f'[previous_{type}]':
+            scope = 'previous'
+            self.needs_previous = True
+        else:
+            raise ValueError(f"{position} {value} of {self.name} request must be in ['[previous_{type}]', '[current_{type}]']")
+        if '@' not in value:
+            self.selection[type] = None
+            return token, self.__compile_getter(scope, type, None)
+        if self.selection[type] is not None:
+            self.selection[type].add(path)
+        return token, self.__compile_getter(scope, type, path)
+
+    @staticmethod
+    def __compile_getter(scope: str, type: str, path: str | None) -> Getter:
+        if scope == 'current':
+            if path is None:
+                return lambda current, previous: current[type]
+            return lambda current, previous: Schema.__pick(current[type], path)
+        if path is None:
+            return lambda current, previous: previous[type]
+        return lambda current, previous: Schema.__pick(previous[type], path)
+
+    @staticmethod
+    def __pick(container: object, path: str):
+        if isinstance(container, dict) and path in container:
+            return container[path]
+        return container
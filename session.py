@@ -0,0 +1,46 @@
+from aiohttp import ClientSession, TCPConnector
+from logging import info
+from metrics import metrics
+from ssl     import create_default_context
+
+class Session:
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 10, keepalive_timeout: float = 30, dns_cache_ttl: int = 300):
+        self.limit             = limit
+        self.limit_per_host    = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl     = dns_cache_ttl
+        self.__ssl_context     = create_default_context()
+        self.__client          = None
+
+    @property
+    def client(self) -> ClientSession:
+        if self.__client is None or self.__client.closed:
+            raise RuntimeError('Session is not opened, call open() before performing requests')
+        return self.__client
+
+    async def open(self):
+        if self.__client is None:
+            connector = TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+                ssl=self.__ssl_context,
+            )
+            self.__client = ClientSession(connector=connector, trace_configs=[metrics.trace_config()])
+            info(f'Session opened, limit {self.limit}, limit per host {self.limit_per_host}')
+        return self
+
+    async def close(self):
+        if self.__client is not None:
+            await self.__client.close()
+            self.__client = None
+            info('Session closed')
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *_):
+        await self.close()
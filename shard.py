@@ -0,0 +1,20 @@
+from hashlib import blake2b
+
+class Shard:
+
+    def __init__(self, index: int = 0, count: int = 1):
+        if count < 1:
+            raise ValueError(f'Shard count {count} must be greater than 0')
+        if not 0 <= index < count:
+            raise ValueError(f'Shard index {index} must be in [0, {count - 1}]')
+        self.index = index
+        self.count = count
+
+    def owner(self, name: str):
+        return max(range(self.count), key=lambda index: blake2b(f'{name}@{index}'.encode(), digest_size=8).digest())
+
+    def owns(self, name: str):
+        return self.count == 1 or self.owner(name) == self.index
+
+    def select(self, configs: list[dict]):
+        return [config for config in configs if self.owns(config['name'])]
@@ -1,24 +1,103 @@
+from aiohttp              import ClientSession
+from asyncio              import Event, Queue, Task, TimeoutError, create_task, gather, to_thread, wait_for
 from email.mime.text      import MIMEText
 from email.mime.multipart import MIMEMultipart
+from hashlib              import blake2b
 from json                 import dumps, loads
-from logging              import info, error
-from re                   import findall
-from requests             import request, RequestException
-from smtplib              import SMTP
+from logging              import info, error, warning
+from metrics              import metrics
+from os                   import fdopen, replace
+from pathlib              import Path
+from re                   import compile
+from session              import Session
+from smtplib              import SMTP, SMTPServerDisconnected
+from tempfile             import mkstemp
+from threading            import Lock
+from time                 import time
+from typing               import Callable, Mapping
 
-class Utility:
+class Template:
 
-    def _translate_text(self, text: str, information: dict):
-        matches = findall(r"\$(.*?)\$", text)
-        for match in matches:
-            if match in information:
-                text = text.replace(f'${match}$', str(information[match]))
-        return text
+    __placeholder = compile(r"\$(.*?)\$")
 
+    @staticmethod
+    def text(text: str) -> Callable[[Mapping], str]:
+        parts = Template.__placeholder.split(text)
+        if len(parts) == 1:
+            return lambda information: text
+        literals, keys = parts[0::2], parts[1::2]
 
-class Email (Utility):
+        def render(information: Mapping):
+            pieces = [literals[0]]
+            for key, literal in zip(keys, literals[1:]):
+                pieces.append(str(information[key]) if key in information else f'${key}$')
+                pieces.append(literal)
+            return ''.join(pieces)
+        return render
 
-    def __init__(self, username: str, password: str, receivers: list[str], subject: str, body: str, server: str = 'smtp.gmail.com', port: int = 587):
+    @staticmethod
+    def json(json: object) -> Callable[[Mapping], object]:
+        if isinstance(json, str):
+            return Template.text(json)
+        if isinstance(json, dict):
+            items = [(Template.text(str(key)), Template.json(value)) for key, value in json.items()]
+            return lambda information: {key(information): value(information) for key, value in items}
+        if isinstance(json, list):
+            items = [Template.json(value) for value in json]
+            return lambda information: [value(information) for value in items]
+        return lambda information: json
+
+
+class Mailer:
+
+    def __init__(self):
+        self.__connections: dict[tuple, SMTP] = {}
+        self.__locks:       dict[tuple, Lock] = {}
+        self.__lock = Lock()
+
+    def send(self, server: str, port: int, starttls: bool, username: str, password: str, receivers: list[str], message: str):
+        key = (server, int(port), starttls, username)
+        with self.__lock:
+            lock = self.__locks.setdefault(key, Lock())
+        with lock:
+            try:
+                self.__connect(key, password).sendmail(username, receivers, message)
+            except (SMTPServerDisconnected, ConnectionError):
+                self.__disconnect(key)
+                self.__connect(key, password).sendmail(username, receivers, message)
+
+    def close(self):
+        for key in list(self.__connections):
+            self.__disconnect(key)
+
+    def __connect(self, key: tuple, password: str):
+        if key not in self.__connections:
+            server, port, starttls, username = key
+            connection = SMTP(server, port)
+            try:
+                if starttls:
+                    connection.starttls()
+                connection.login(username, password)
+            except Exception:
+                connection.close()
+                raise
+            self.__connections[key] = connection
+            info(f'SMTP connection opened to {server}:{port} as {username}')
+        return self.__connections[key]
+
+    def __disconnect(self, key: tuple):
+        connection = self.__connections.pop(key, None)
+        if connection is None:
+            return
+        try:
+            connection.quit()
+        except Exception:
+            connection.close()
+
+
+class Email:
+
+    def __init__(self, username: str, password: str, receivers: list[str], subject: str, body: str, server: str = 'smtp.gmail.com', port: int = 587, starttls: bool = True):
         self.username    = username
         self.password    = password
         self.receivers   = receivers
@@ -26,57 +105,269 @@ class Email (Utility):
         self.body        = body
         self.server      = server
         self.port        = port
+        self.starttls    = starttls
+        self.__subject   = Template.text(subject)
+        self.__body      = Template.text(body)
+
+    def render(self, information: Mapping):
+        return self.__subject(information), self.__body(information)
+
+    async def perform(self, information: Mapping, mailer: Mailer):
+        return await self.__deliver(*self.render(information), mailer)
 
-    def perform(self, information: dict):
+    @staticmethod
+    async def perform_digest(alerts: list[tuple['Email', Mapping]], mailer: Mailer):
+        rendered = [email.render(information) for email, information in alerts]
+        subject  = f'{rendered[0][0]} (+{len(rendered) - 1} more)' if len(rendered) > 1 else rendered[0][0]
+        return await alerts[0][0].__deliver(subject, '\n\n---\n\n'.join(body for _, body in rendered), mailer)
+
+    async def __deliver(self, subject: str, body: str, mailer: Mailer):
         try:
             message            = MIMEMultipart()
             message['From']    = self.username
             message['To']      = ', '.join(self.receivers)
-            message['Subject'] = super()._translate_text(self.subject, information)
-            message.attach(MIMEText(super()._translate_text(self.body, information)))
-            with SMTP(self.server, self.port) as server:
-                server.starttls()
-                server.login(self.username, self.password)
-                server.sendmail(self.username, self.receivers, message.as_string())
+            message['Subject'] = subject
+            message.attach(MIMEText(body))
+            await to_thread(mailer.send, self.server, self.port, self.starttls, self.username, self.password, self.receivers, message.as_string())
             info(f'Sent Email to {', '.join(self.receivers)}')
+            return True
         except Exception as exception:
             error(f'Error when sending email, {exception}')
+            return False
 
 
-class Request (Utility):
+class Request:
 
     def __init__(self, url: str, method: str, headers: dict[str, str], body: dict):
         self.url          = url
         self.method       = method.upper()
         self.headers      = headers
         self.body         = body
+        self.__headers    = Template.json(headers)
+        self.__body       = Template.json(body)
+
+    def render(self, information: Mapping):
+        return self.__headers(information), self.__body(information)
+
+    async def perform(self, information: Mapping, session: ClientSession):
+        return await self.__deliver(*self.render(information), session)
 
-    def perform(self, information: dict):
+    @staticmethod
+    async def perform_digest(alerts: list[tuple['Request', Mapping]], session: ClientSession):
+        rendered = [request.render(information) for request, information in alerts]
+        return await alerts[0][0].__deliver(rendered[0][0], {'alerts': [body for _, body in rendered]}, session)
+
+    async def __deliver(self, headers: dict[str, str], body: dict, session: ClientSession):
         try:
-            response = request(url=self.url, method=self.method, headers=self.__translate_json(self.headers, information), json=self.__translate_json(self.body, information))
-            if response.status_code >= 400:
-                raise RequestException(f'Request action unsucessful, status {response.status_code}')
+            async with session.request(url=self.url, method=self.method, headers=headers, json=body) as response:
+                if response.status >= 400:
+                    raise Exception(f'Request action unsucessful, status {response.status}')
             info(f'Sent Request to {self.url} using {self.method} method')
+            return True
         except Exception as exception:
             error(f'Error when sending request, {exception}')
-
-    def __translate_json(self, json: dict, information: dict):
-        return loads(super()._translate_text(dumps(json), information))
+            return False
 
 class Trigger:
 
-    def __init__(self, action: str, email: Email, request: Request):
-        self.action  = action
-        self.email   = email
-        self.request = request
+    def __init__(self, action: str, email: Email, request: Request, cooldown: float = 0, deduplicate: bool = False):
+        self.action      = action
+        self.email       = email
+        self.request     = request
+        self.cooldown    = cooldown
+        self.deduplicate = deduplicate
+
+    def destination(self):
+        match self.action:
+            case 'email':
+                return self.action, self.email.server, int(self.email.port), self.email.starttls, self.email.username, tuple(self.email.receivers)
+            case 'request':
+                return self.action, self.request.method, self.request.url
+        return (self.action,)
 
-    def perform(self, information: dict):
+    async def perform(self, information: Mapping, mailer: Mailer, session: ClientSession):
         match self.action:
             case 'none':
                 info("Trigger action is 'none', nothing performed")
-                return
+                return True
             case 'email':
-                self.email.perform(information)
+                return await self.email.perform(information, mailer)
             case 'request':
-                self.request.perform(information)
+                return await self.request.perform(information, session)
+        return False
+
+    @staticmethod
+    async def perform_digest(alerts: list[tuple['Trigger', Mapping]], mailer: Mailer, session: ClientSession):
+        if len(alerts) == 1:
+            return await alerts[0][0].perform(alerts[0][1], mailer, session)
+        match alerts[0][0].action:
+            case 'none':
+                info(f"Trigger action is 'none', nothing performed for {len(alerts)} alerts")
+                return True
+            case 'email':
+                return await Email.perform_digest([(trigger.email, information) for trigger, information in alerts], mailer)
+            case 'request':
+                return await Request.perform_digest([(trigger.request, information) for trigger, information in alerts], session)
+        return False
+
+
+class Silencer:
+
+    def __init__(self, path: str = None):
+        self.path       = path
+        self.__state:    dict[str, dict] = None
+        self.__recorded: set[str]        = set()
+
+    def allow(self, trigger: Trigger, information: Mapping):
+        if trigger.cooldown <= 0 and not trigger.deduplicate:
+            return True
+        state = self.__load().get(information['request.name'])
+        if state is None:
+            return True
+        if trigger.cooldown > 0 and time() - state['sent'] < trigger.cooldown:
+            return False
+        if trigger.deduplicate and state['fingerprint'] == Silencer.fingerprint(information):
+            return False
+        return True
+
+    def record(self, trigger: Trigger, information: Mapping):
+        if trigger.cooldown <= 0 and not trigger.deduplicate:
+            return False
+        self.__load()[information['request.name']] = {'sent': time(), 'fingerprint': Silencer.fingerprint(information)}
+        self.__recorded.add(information['request.name'])
+        return True
+
+    def forget(self, trigger: Trigger, name: str):
+        if not trigger.deduplicate:
+            return False
+        state = self.__load().get(name)
+        if state is None or state['fingerprint'] is None:
+            return False
+        state['fingerprint'] = None
+        self.__recorded.add(name)
+        return True
+
+    def save(self):
+        if self.path is None or not self.__recorded:
+            return
+        file_path = Path(self.path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        state = self.__read()
+        state.update({name: self.__state[name] for name in self.__recorded})
+        descriptor, temporary_path = mkstemp(dir=file_path.parent, prefix=f'.{file_path.name}.', suffix='.tmp')
+        try:
+            with fdopen(descriptor, 'w') as temporary_file:
+                temporary_file.write(dumps(state, indent=4))
+            Path(temporary_path).chmod(0o644)
+            replace(temporary_path, file_path)
+        except Exception:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
+        self.__recorded.clear()
+
+    @staticmethod
+    def fingerprint(information: Mapping):
+        return blake2b(dumps(dict(information), sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+    def __load(self):
+        if self.__state is None:
+            self.__state = self.__read()
+        return self.__state
+
+    def __read(self):
+        if self.path is None or not Path(self.path).exists():
+            return {}
+        try:
+            return loads(Path(self.path).read_text())
+        except ValueError as exception:
+            warning(f'Trigger state {self.path} is unreadable and ignored, {exception}')
+            return {}
+
+
+class Dispatcher:
+
+    def __init__(self, session: Session, workers: int = 4, queue_size: int = 100, coalesce_window: float = 0, state_file: str = None):
+        self.session         = session
+        self.workers         = workers
+        self.queue_size      = queue_size
+        self.coalesce_window = coalesce_window
+        self.__mailer        = Mailer()
+        self.__silencer      = Silencer(state_file)
+        self.__queue:   Queue      = None
+        self.__tasks:   list[Task] = []
+        self.__groups:  dict[tuple, dict[str, tuple[Trigger, Mapping]]] = {}
+        self.__holds:   dict[tuple, Task] = {}
+        self.__closing: Event = None
+
+    async def open(self):
+        if self.__queue is None:
+            self.__queue   = Queue(self.queue_size)
+            self.__closing = Event()
+            self.__tasks   = [create_task(self.__work()) for _ in range(self.workers)]
+        return self
+
+    async def submit(self, trigger: Trigger, information: Mapping):
+        if not self.__silencer.allow(trigger, information):
+            info(f"Trigger of {information['request.name']} request suppressed by cooldown or deduplication")
+            metrics.triggers.inc(action=trigger.action, outcome='suppressed')
+            return
+        if self.coalesce_window <= 0:
+            await self.__queue.put([(trigger, information)])
+            return
+        key = trigger.destination()
+        self.__groups.setdefault(key, {})[information['request.name']] = (trigger, information)
+        if key not in self.__holds:
+            self.__holds[key] = create_task(self.__hold(key))
+
+    def recover(self, trigger: Trigger, name: str):
+        if self.__silencer.forget(trigger, name):
+            info(f'Request {name} recovered, deduplication of its next alert reset')
+            self.__silencer.save()
+
+    async def close(self):
+        if self.__queue is None:
+            return
+        self.__closing.set()
+        while self.__holds:
+            await gather(*list(self.__holds.values()), return_exceptions=True)
+        await self.__queue.join()
+        for task in self.__tasks:
+            task.cancel()
+        await gather(*self.__tasks, return_exceptions=True)
+        await to_thread(self.__mailer.close)
+        self.__queue = None
+        self.__tasks = []
+
+    async def __hold(self, key: tuple):
+        try:
+            await wait_for(self.__closing.wait(), self.coalesce_window)
+        except TimeoutError:
+            pass
+        alerts = list(self.__groups.pop(key).values())
+        del self.__holds[key]
+        if len(alerts) > 1:
+            info(f'Coalesced {len(alerts)} alerts for {key[0]} destination')
+        await self.__queue.put(alerts)
+
+    async def __work(self):
+        while True:
+            alerts = await self.__queue.get()
+            action = alerts[0][0].action
+            try:
+                with metrics.timer('trigger'):
+                    ok = await Trigger.perform_digest(alerts, self.__mailer, self.session.client)
+                metrics.triggers.inc(len(alerts), action=action, outcome='success' if ok else 'error')
+                recorded = [self.__silencer.record(trigger, information) for trigger, information in alerts] if ok else []
+                if any(recorded):
+                    self.__silencer.save()
+            except Exception as exception:
+                metrics.triggers.inc(len(alerts), action=action, outcome='error')
+                error(f'Error when performing trigger, {exception}')
+            finally:
+                self.__queue.task_done()
+
+    async def __aenter__(self):
+        return await self.open()
 
+    async def __aexit__(self, *_):
+        await self.close()